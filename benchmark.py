@@ -0,0 +1,409 @@
+import sys
+import os
+import io
+import re
+import json
+import time
+import random
+import string
+import asyncio
+import argparse
+import platform
+import threading
+import contextlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+os.environ.setdefault("DEEPSEEK_API_KEY", "benchmark")
+os.environ.setdefault("BAILIAN_API_KEY", "benchmark")
+
+import spacy
+import util
+import word_check
+import sentence_check
+import section_check
+from loader import parse_document
+
+common_words = [
+    "the", "model", "data", "results", "we", "propose", "a", "method", "for", "learning",
+    "with", "training", "of", "and", "to", "in", "is", "that", "our", "approach",
+    "performance", "improves", "baseline", "on", "benchmark", "datasets", "experiments", "show", "this", "task",
+    "network", "layer", "loss", "function", "using", "which", "are", "by", "from", "as",
+    "each", "input", "output", "representation", "features", "attention", "large", "small", "better", "than",
+    "previous", "work", "paper", "section", "table", "figure", "accuracy", "evaluation", "setting", "analysis",
+]
+name_words = ["Smith", "Zhang", "Wang", "Johnson", "Li", "Garcia", "Chen", "Brown", "Liu", "Miller"]
+
+def rare_word(rng):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(6, 12)))
+
+def bracket_token(rng):
+    word = rng.choice(common_words)
+    return rng.choice([
+        f"({word} {rng.choice(common_words)})", f"[{rng.randint(1, 60)}]", f"{{{word}}}",
+        f"<{word}>", f"“{word}”", f"({word}", f"{word})",
+    ])
+
+def formula_token(rng):
+    return rng.choice(["$x_i$", "$\\alpha + \\beta$", "$$\\sum_{i=1}^n x_i$$", "$f(x)$", "$$y = Wx + b$$"])
+
+def hyphen_token(rng):
+    return rng.choice(["state-of-the-art", "well-known", "-dash", "x—y", "end-to-end", "and/or", "/path", "pre-/post-"])
+
+def number_token(rng):
+    return rng.choice(["12.5%", "2020a", "3rd", "1,000", "10K", f"{rng.randint(0, 999)}", "foo@bar", "†"])
+
+noise_kinds = {
+    "brackets": bracket_token,
+    "formulas": formula_token,
+    "hyphens": hyphen_token,
+    "rare": rare_word,
+    "names": lambda rng: rng.choice(name_words),
+    "numbers": number_token,
+}
+
+def generate_sentence(rng, noise, kinds):
+    words = []
+    for _ in range(rng.randint(6, 24)):
+        if kinds and rng.random() < noise:
+            words.append(noise_kinds[rng.choice(kinds)](rng))
+        else:
+            words.append(rng.choice(common_words))
+    words[0] = words[0][:1].upper() + words[0][1:]
+    return " ".join(words) + rng.choice([".", ".", ".", "?", "!"])
+
+def generate_paper(paragraphs=20, noise=0.1, seed=0, kinds=None):
+    rng = random.Random(seed)
+    kinds = list(noise_kinds) if kinds is None else kinds
+    data = dict()
+    structure = dict()
+
+    def add_paragraphs(num):
+        ids = []
+        for _ in range(num):
+            idx = f"p{len(data)}"
+            data[idx] = " ".join(generate_sentence(rng, noise, kinds) for _ in range(rng.randint(2, 8)))
+            ids.append(idx)
+        return ids
+
+    structure["Title"] = add_paragraphs(1)
+    structure["Abstract"] = add_paragraphs(1)
+    for name in ["1 Introduction", "2 Related Work", "4 Experiment", "6 Appendix"]:
+        structure[name] = {
+            f"{name}.{sub}": add_paragraphs(max(1, paragraphs // 3))
+            for sub in range(1, 4)
+        }
+    structure["5 Conclusion"] = add_paragraphs(max(1, paragraphs // 5))
+    return {"structure": structure, "data": data}
+
+class LocalMatch:
+    def __init__(self, ruleId, offset, errorLength, message, replacements):
+        self.ruleId = ruleId
+        self.offset = offset
+        self.errorLength = errorLength
+        self.message = message
+        self.replacements = replacements
+
+class LocalLanguageTool:
+    pattern = re.compile(r"\b(\w+) \1\b|\bi\b|  +|\b[a-z]{10,}\b")
+    latency = 0.0
+    calls = 0
+
+    def __init__(self, language, **kwargs):
+        self.language = language
+
+    def check(self, text):
+        LocalLanguageTool.calls += 1
+        time.sleep(self.latency + len(text) * 1e-6)
+        matches = []
+        for match in self.pattern.finditer(text):
+            matches.append(LocalMatch("LOCAL_RULE", match.start(), match.end() - match.start(), "local rule", []))
+        return matches
+
+    def close(self):
+        pass
+
+class LocalLLMHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    requests = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        LocalLLMHandler.requests += 1
+        time.sleep(self.latency)
+        user = request["messages"][-1]["content"]
+        finding = {"type": "spelling", "sentence": "", "description": "local", "suggestion": ""}
+        names = re.findall(r'<section name="([^"]+)">', user)
+        result = {name: [finding] for name in names} if names else [finding]
+        content = "```json\n" + json.dumps(result) + "\n```"
+        if request.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for i in range(0, len(content), 16):
+                chunk = {
+                    "id": "local", "object": "chat.completion.chunk", "created": 0, "model": request["model"],
+                    "choices": [{
+                        "index": 0, "delta": {"content": content[i:i + 16]},
+                        "finish_reason": "stop" if i + 16 >= len(content) else None,
+                    }],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+            return
+        body = json.dumps({
+            "id": "local", "object": "chat.completion", "created": 0, "model": request["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_local_llm(latency):
+    LocalLLMHandler.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), LocalLLMHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def timed(func, *args, repeat=1):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def bench_word(data, repeat, spell_cache_path):
+    stages = dict()
+    profiler = word_check.CheckProfiler()
+    word_check.check_words(data, "benchmark", spell_cache_path, profiler)
+    for record in profiler.records:
+        stages[record["check"]] = {
+            "seconds": record["seconds"],
+            f"{record['unit']}_in": record["input_size"],
+            f"{record['unit']}_out": record["output_size"],
+        }
+
+    elapsed, _ = timed(word_check.check_words, data, "benchmark", spell_cache_path, repeat=repeat)
+    stages["check_words"] = {"seconds": elapsed}
+    return stages
+
+def bench_sentence(data, repeat, batch_chars, workers):
+    stages = dict()
+    elapsed, sentences = timed(sentence_check.split_sentences, data, repeat=repeat)
+    stages["split_sentences"] = {"seconds": elapsed, "sentences": len(sentences)}
+
+    pool = sentence_check.LanguageToolPool('en-US', servers=1, workers=workers)
+    LocalLanguageTool.calls = 0
+    elapsed, matches_list = timed(sentence_check.check_sentences, pool, sentences, batch_chars, repeat=repeat)
+    stages["check_sentences"] = {"seconds": elapsed, "requests": LocalLanguageTool.calls // repeat}
+    pool.close()
+
+    elapsed, _ = timed(sentence_check.format_sentence_report, sentences, matches_list, repeat=repeat)
+    stages["format_sentence_report"] = {"seconds": elapsed}
+    return stages
+
+def run_section_check(data, llm_config, max_tokens, pack_tokens):
+    async def run():
+        section_check.async_client = util.AsyncClientWrapper(llm_config)
+        return await section_check.check_sections(data, None, max_tokens, pack_tokens)
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        report = asyncio.run(run())
+    missing = [key for key in data if f"## {key}\n" not in report]
+    if missing:
+        errors = [line for line in output.getvalue().splitlines() if "exception" in line]
+        raise AssertionError(f"section report is missing {missing}\n" + "\n".join(errors))
+    return report
+
+def bench_section(data, repeat, llm_config, max_tokens, pack_tokens):
+    stages = dict()
+    elapsed, bins = timed(section_check.pack_sections, data, pack_tokens, repeat=repeat)
+    stages["pack_sections"] = {"seconds": elapsed, "bins": len(bins)}
+
+    LocalLLMHandler.requests = 0
+    elapsed, _ = timed(run_section_check, data, llm_config, max_tokens, pack_tokens, repeat=repeat)
+    stages["check_sections"] = {"seconds": elapsed, "requests": LocalLLMHandler.requests // repeat}
+    return stages
+
+def generate_tokens(num_tokens, noise, seed, kinds):
+    tokens = []
+    while len(tokens) < num_tokens:
+        json_data = generate_paper(100, noise, seed + len(tokens), kinds)
+        text = word_check.join_sections(parse_document(json_data).section_texts())
+        tokens.extend(word_check.split_words(text))
+    return tokens[:num_tokens]
+
+def filter_words_reference(check, word_list):
+    result = []
+    for word in word_list:
+        if not any(re.findall(pattern, word) for pattern in check.patterns):
+            result.append(word)
+    return result
+
+def bench_filter_words(num_tokens, noise, seed, kinds, repeat):
+    tokens = generate_tokens(num_tokens, noise, seed, kinds)
+    check = word_check.FilterWords()
+    reference_seconds, reference = timed(filter_words_reference, check, tokens, repeat=repeat)
+    seconds, result = timed(check.forward, tokens, repeat=repeat)
+    if result != reference:
+        raise AssertionError("FilterWords output differs from the per-pattern reference")
+    return {
+        "tokens": len(tokens),
+        "unique_tokens": len(set(tokens)),
+        "tokens_out": len(result),
+        "seconds": seconds,
+        "tokens_per_second": len(tokens) / seconds,
+        "reference_seconds": reference_seconds,
+        "reference_tokens_per_second": len(tokens) / reference_seconds,
+    }
+
+def spell_check_reference(nlp, word_list):
+    result = []
+    for word in word_list:
+        original_lower = word.lower()
+        if word_check.spell_dict.check(original_lower):
+            result.append(True)
+            continue
+        doc = nlp(original_lower)
+        lemma = doc[0].lemma_ if len(doc) > 0 else original_lower
+        result.append(lemma != original_lower and word_check.spell_dict.check(lemma))
+    return result
+
+def bench_spell_check(num_tokens, noise, seed, kinds, repeat):
+    words = [token for token in generate_tokens(num_tokens, noise, seed, kinds) if token.isalpha()]
+    nlp = spacy.load("en_core_web_sm")
+    reference_seconds, reference = timed(spell_check_reference, nlp, words, repeat=repeat)
+    seconds, result = timed(word_check.spell_check_batch, words, repeat=repeat)
+    if result != reference:
+        raise AssertionError("spell_check_batch verdicts differ from the per-word reference")
+    return {
+        "words": len(words),
+        "unique_words": len(set(words)),
+        "seconds": seconds,
+        "words_per_second": len(words) / seconds,
+        "reference_seconds": reference_seconds,
+        "reference_words_per_second": len(words) / reference_seconds,
+    }
+
+def run_benchmark(args):
+    sentence_check.LanguageTool = LocalLanguageTool
+    LocalLanguageTool.latency = args.lt_latency
+    server = start_local_llm(args.llm_latency)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    llm_config = [{"api_key": "local", "base_url": base_url, "model": "local", "max_concurrency": args.llm_concurrency}]
+
+    results = []
+    for paragraphs in args.paragraphs:
+        for noise in args.noise:
+            json_data = generate_paper(paragraphs, noise, args.seed, args.kinds)
+            load_seconds, document = timed(parse_document, json_data, repeat=args.repeat)
+            data = document.section_texts()
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                word = bench_word(data, args.repeat, args.spell_cache_path)
+                sentence = bench_sentence(data, args.repeat, args.batch_chars, args.workers)
+                section = bench_section(data, args.repeat, llm_config, args.max_section_tokens, args.pack_tokens)
+            result = {
+                "paragraphs": paragraphs,
+                "noise": noise,
+                "chars": sum(len(text) for text in data.values()),
+                "load": {"seconds": load_seconds},
+                "word": word,
+                "sentence": sentence,
+                "section": section,
+            }
+            results.append(result)
+            print(f"paragraphs {paragraphs}, noise {noise}: {result['chars']} chars, "
+                  f"word {word['check_words']['seconds']:.3f}s, "
+                  f"sentence {sentence['check_sentences']['seconds']:.3f}s, "
+                  f"section {section['check_sections']['seconds']:.3f}s")
+    server.shutdown()
+    return results
+
+def write_report(args, results, extra=None):
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "generate")},
+        "results": results,
+    }
+    report.update(extra or dict())
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4)
+    print(f"benchmark -> {args.output}")
+
+def compare(results, baseline):
+    baseline_map = {(item["paragraphs"], item["noise"]): item for item in baseline["results"]}
+    for result in results:
+        old = baseline_map.get((result["paragraphs"], result["noise"]))
+        if old is None:
+            continue
+        print(f"paragraphs {result['paragraphs']}, noise {result['noise']}")
+        for group in ["word", "sentence", "section"]:
+            for stage, stats in result[group].items():
+                old_stats = old.get(group, dict()).get(stage)
+                if old_stats and old_stats["seconds"] > 0:
+                    ratio = stats["seconds"] / old_stats["seconds"]
+                    print(f"  {group + '.' + stage:<36} {old_stats['seconds']:9.4f}s -> {stats['seconds']:9.4f}s ({ratio:.2f}x)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the word, sentence and section checks on synthetic papers")
+    parser.add_argument("--paragraphs", type=lambda value: [int(item) for item in value.split(",")], default=[10, 50, 200], help="comma separated paragraphs per section")
+    parser.add_argument("--noise", type=lambda value: [float(item) for item in value.split(",")], default=[0.0, 0.1, 0.3], help="comma separated fraction of noisy tokens")
+    parser.add_argument("--kinds", type=lambda value: value.split(","), default=None, help=f"comma separated noise kinds out of {','.join(noise_kinds)} (default: all)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="runs per stage, the fastest is reported")
+    parser.add_argument("--spell-cache-path", default="", help="spell check cache for the word check, empty string (default) measures uncached lookups")
+    parser.add_argument("--batch-chars", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-section-tokens", type=int, default=3000)
+    parser.add_argument("--pack-tokens", type=int, default=1500)
+    parser.add_argument("--lt-latency", type=float, default=0.01, help="seconds per request of the local LanguageTool stand-in")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per request of the local LLM stand-in")
+    parser.add_argument("--llm-concurrency", type=int, default=4)
+    parser.add_argument("--filter-words", type=int, default=None, help="only measure FilterWords throughput on this many synthetic tokens, e.g. 100000")
+    parser.add_argument("--spell-check", type=int, default=None, help="only measure spell check throughput on the alphabetic words among this many synthetic tokens, e.g. 20000")
+    parser.add_argument("--generate", default=None, help="only write one synthetic paper to this path, using the first --paragraphs and --noise values")
+    parser.add_argument("--output", default="./data/benchmark.json")
+    parser.add_argument("--baseline", default=None, help="earlier benchmark json to compare against")
+    args = parser.parse_args()
+
+    if args.generate:
+        with open(args.generate, 'w', encoding='utf-8') as f:
+            json.dump(generate_paper(args.paragraphs[0], args.noise[0], args.seed, args.kinds), f, indent=4)
+        return
+
+    if args.filter_words:
+        filter_words = bench_filter_words(args.filter_words, args.noise[0], args.seed, args.kinds, args.repeat)
+        print(f"FilterWords: {filter_words['tokens']} tokens ({filter_words['unique_tokens']} unique), "
+              f"{filter_words['tokens_per_second']:.0f} tokens/s, "
+              f"per-pattern reference {filter_words['reference_tokens_per_second']:.0f} tokens/s")
+        write_report(args, [], {"filter_words": filter_words})
+        return
+
+    if args.spell_check:
+        spell_check = bench_spell_check(args.spell_check, args.noise[0], args.seed, args.kinds, args.repeat)
+        print(f"spell check: {spell_check['words']} words ({spell_check['unique_words']} unique), "
+              f"{spell_check['words_per_second']:.0f} words/s, "
+              f"per-word reference {spell_check['reference_words_per_second']:.0f} words/s")
+        write_report(args, [], {"spell_check": spell_check})
+        return
+
+    results = run_benchmark(args)
+    write_report(args, results)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+def content_hash(*parts):
+    hasher = hashlib.sha256()
+    for part in parts:
+        hasher.update(str(part).encode("utf-8"))
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+class DiskCache:
+    def __init__(self, path, max_entries=100000, ttl=None, chunk_size=500):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.chunk_size = chunk_size
+        self.local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def connect(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS entries ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                    "created REAL NOT NULL, accessed REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+            self.local.conn = conn
+        return conn
+
+    def chunks(self, items):
+        for i in range(0, len(items), self.chunk_size):
+            yield items[i:i + self.chunk_size]
+
+    def get_many(self, keys):
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return dict()
+        conn = self.connect()
+        now = time.time()
+        min_created = now - self.ttl if self.ttl else 0
+        result = dict()
+        for chunk in self.chunks(keys):
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT key, value FROM entries WHERE key IN ({placeholders}) AND created >= ?",
+                (*chunk, min_created)
+            ).fetchall()
+            for key, value in rows:
+                result[key] = json.loads(value)
+        with conn:
+            for chunk in self.chunks(list(result.keys())):
+                placeholders = ",".join("?" * len(chunk))
+                conn.execute(f"UPDATE entries SET accessed = ? WHERE key IN ({placeholders})", (now, *chunk))
+        self.hits += len(result)
+        self.misses += len(keys) - len(result)
+        return result
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def set_many(self, items):
+        if not items:
+            return
+        conn = self.connect()
+        now = time.time()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO entries (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                [(key, json.dumps(value), now, now) for key, value in items.items()]
+            )
+        self.evict()
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def delete(self, key):
+        conn = self.connect()
+        with conn:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def evict(self):
+        conn = self.connect()
+        with conn:
+            if self.ttl:
+                conn.execute("DELETE FROM entries WHERE created < ?", (time.time() - self.ttl,))
+            if self.max_entries:
+                count = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+                if count > self.max_entries:
+                    conn.execute(
+                        "DELETE FROM entries WHERE key IN "
+                        "(SELECT key FROM entries ORDER BY accessed LIMIT ?)",
+                        (count - self.max_entries,)
+                    )
+
+    def __len__(self):
+        return self.connect().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def close(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
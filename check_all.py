@@ -0,0 +1,105 @@
+import sys
+import os
+import time
+import asyncio
+import argparse
+import word_check
+import sentence_check
+import section_check
+from loader import load_document
+from incremental import output_path, state_path, paragraph_hashes, diff_paragraphs, load_state, save_state
+
+
+async def run_stage(name, timings, awaitable):
+    start = time.perf_counter()
+    try:
+        output_path = await awaitable
+        print(f"{name} check -> {output_path}")
+    except Exception as exc:
+        print(f"{name} check generated an exception: {exc}")
+    timings[name] = time.perf_counter() - start
+
+def load_previous(file_path, previous_path, document):
+    state = load_state(state_path(previous_path))
+    if state is None:
+        print(f"no previous results for {previous_path}, checking every paragraph")
+        return None, []
+    added, removed, changed = diff_paragraphs(state["paragraphs"], paragraph_hashes(document))
+    print(f"paragraphs: {len(added)} added, {len(removed)} removed, {len(changed)} changed")
+    return state["sentences"], added + changed
+
+async def check_all(file_path, args):
+    timings = dict()
+    start = time.perf_counter()
+    document = load_document(file_path)
+    data = document.section_texts()
+    timings["load"] = time.perf_counter() - start
+
+    sentence_options = dict(
+        batch_chars=args.batch_chars, servers=args.servers, workers=args.workers,
+        remote_server=args.remote_server, cache_path=args.cache_path
+    )
+    records_path = None
+    sentence_results = dict()
+    if args.incremental:
+        previous_path = args.previous or file_path
+        previous_sentences, dirty_ids = load_previous(file_path, previous_path, document)
+        records_path = output_path(previous_path, "section.jsonl")
+
+        def check_sentences():
+            output_path, results = sentence_check.check_file_incremental(
+                file_path, document, previous_sentences, dirty_ids, **sentence_options
+            )
+            sentence_results.update(results)
+            return output_path
+        sentence_stage = asyncio.to_thread(check_sentences)
+    else:
+        sentence_stage = asyncio.to_thread(sentence_check.check_file, file_path, data, **sentence_options)
+
+    await asyncio.gather(
+        run_stage("section", timings, section_check.check_file(
+            file_path, data, max_tokens=args.max_section_tokens,
+            pack_tokens=args.pack_tokens, resume=not args.no_resume, records_path=records_path
+        )),
+        run_stage("sentence", timings, sentence_stage),
+        run_stage("word", timings, asyncio.to_thread(word_check.check_file, file_path, data)),
+    )
+    if sentence_results:
+        save_state(state_path(file_path), document, sentence_results)
+    timings["total"] = time.perf_counter() - start
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description="Word, sentence and section level check in one process")
+    parser.add_argument("json_file_path")
+    parser.add_argument("--batch-chars", type=int, default=5000, help="max characters per LanguageTool request, 0 checks one sentence per request")
+    parser.add_argument("--servers", type=int, default=1, help="number of local LanguageTool servers to start")
+    parser.add_argument("--workers", type=int, default=None, help="number of concurrent LanguageTool requests (default: cpu count)")
+    parser.add_argument("--remote-server", default=None, help="url of a running LanguageTool server to use instead of local ones")
+    parser.add_argument("--cache-path", default="./cache/sentence.sqlite", help="sentence result cache, empty string disables it")
+    parser.add_argument("--hedge-percentile", type=float, default=None, help="send a duplicate request to another endpoint once a request is slower than this latency percentile, e.g. 0.95")
+    parser.add_argument("--max-section-tokens", type=int, default=3000, help="split longer sections into chunks of about this many tokens at paragraph boundaries, 0 to disable")
+    parser.add_argument("--pack-tokens", type=int, default=1500, help="send sections smaller than this many tokens together in one request, 0 to disable")
+    parser.add_argument("--no-resume", action="store_true", help="recheck every section instead of reusing finished ones from the jsonl sidecar")
+    parser.add_argument("--incremental", action="store_true", help="only recheck paragraphs that changed since the last incremental run")
+    parser.add_argument("--previous", default=None, help="previous version of the paper whose results --incremental starts from (default: the same file)")
+    args = parser.parse_args()
+    if args.previous is not None:
+        args.incremental = True
+
+    file_path = args.json_file_path
+    if not os.path.exists(file_path):
+        print(f"File not found: {file_path}")
+        sys.exit(1)
+
+    section_check.async_client.chat.completions.hedge_percentile = args.hedge_percentile
+    timings = asyncio.run(check_all(file_path, args))
+    section_check.print_stats()
+
+    print("stage      seconds")
+    for name in ["load", "word", "sentence", "section", "total"]:
+        if name in timings:
+            print(f"{name:<10} {timings[name]:7.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import os
+import json
+from cache import content_hash
+
+
+def output_path(file_path, suffix):
+    base_name = os.path.basename(file_path)
+    return f"./data/{base_name.split('.')[0]}_{suffix}"
+
+def state_path(file_path):
+    return output_path(file_path, "state.json")
+
+def paragraph_hashes(document):
+    hashes = dict()
+    for ids in document.sections.values():
+        for idx in ids:
+            if idx not in hashes:
+                hashes[idx] = content_hash(document.paragraphs[idx])
+    return hashes
+
+def diff_paragraphs(old_hashes, new_hashes):
+    added = [idx for idx in new_hashes if idx not in old_hashes]
+    removed = [idx for idx in old_hashes if idx not in new_hashes]
+    changed = [idx for idx in new_hashes if idx in old_hashes and old_hashes[idx] != new_hashes[idx]]
+    return added, removed, changed
+
+def load_state(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if not isinstance(state, dict) or "paragraphs" not in state:
+        return None
+    return state
+
+def save_state(path, document, sentences):
+    state = {
+        "paragraphs": paragraph_hashes(document),
+        "sentences": sentences,
+    }
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
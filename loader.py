@@ -0,0 +1,127 @@
+import sys
+import os
+import json
+import time
+import pickle
+
+CACHE_VERSION = 1
+
+section_name_list = [
+    "title",
+    "abstract",
+    "introduction",
+    "related work",
+    "experiment",
+    "conclusion",
+    "limitation",
+    "appendix",
+    "checklist",
+    "image",
+    "table",
+]
+
+
+def flatten_ids(structure):
+    ids = []
+    stack = [structure]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, str):
+            ids.extend(idx for idx in node.split("\n") if idx != "")
+        elif isinstance(node, list):
+            stack.extend(reversed(node))
+        elif isinstance(node, dict):
+            stack.extend(reversed(list(node.values())))
+    return ids
+
+class Document:
+    def __init__(self, sections, paragraphs):
+        self.sections = sections
+        self.paragraphs = paragraphs
+
+    def section_text(self, key):
+        return "\n".join(self.paragraphs[idx] for idx in self.sections[key])
+
+    def section_texts(self):
+        return {key: self.section_text(key) for key in self.sections}
+
+def parse_document(json_data):
+    section_ids = dict()
+    for key, structure in json_data['structure'].items():
+        for sn in section_name_list:
+            if sn in key.lower():
+                section_ids[sn] = flatten_ids(structure)
+    data = json_data['data']
+    sections = dict()
+    paragraphs = dict()
+    for key, ids in section_ids.items():
+        for idx in ids:
+            paragraphs[idx] = data[idx]
+        if "\n".join(paragraphs[idx] for idx in ids) != "":
+            sections[key] = ids
+    if "related work" in sections:
+        sections['related_work'] = sections.pop("related work")
+    return Document(sections, paragraphs)
+
+def cache_path(json_path):
+    return os.path.splitext(json_path)[0] + ".doc.pkl"
+
+def source_signature(json_path):
+    stat = os.stat(json_path)
+    return CACHE_VERSION, stat.st_size, stat.st_mtime_ns
+
+def read_cache(json_path):
+    path = cache_path(json_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            signature, document = pickle.load(f)
+    except (OSError, EOFError, ValueError, TypeError, pickle.UnpicklingError, AttributeError):
+        return None
+    if signature != source_signature(json_path):
+        return None
+    return document
+
+def write_cache(json_path, document):
+    path = cache_path(json_path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((source_signature(json_path), document), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def load_document(json_path, use_cache=True):
+    if use_cache:
+        document = read_cache(json_path)
+        if document is not None:
+            return document
+    with open(json_path, encoding='utf-8') as f:
+        json_data = json.load(f)
+    document = parse_document(json_data)
+    if use_cache:
+        write_cache(json_path, document)
+    return document
+
+def read_structure_data(json_path, use_cache=True):
+    return load_document(json_path, use_cache).section_texts()
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python loader.py <json_file_path> [<json_file_path> ...]")
+        sys.exit(1)
+
+    for json_path in sys.argv[1:]:
+        if not os.path.exists(json_path):
+            print(f"File not found: {json_path}")
+            sys.exit(1)
+        start = time.perf_counter()
+        document = load_document(json_path, use_cache=False)
+        write_cache(json_path, document)
+        print(f"{json_path} -> {cache_path(json_path)} ({len(document.sections)} sections, {len(document.paragraphs)} paragraphs, {time.perf_counter() - start:.3f}s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import sys
+import os
+import mmap
+import time
+import bisect
+import struct
+from array import array
+
+MAGIC = b"NAMEIDX1"
+HEADER = struct.Struct("8sqqI")
+HEADER_SIZE = 32
+
+
+def index_path(source_path):
+    return os.path.splitext(source_path)[0] + ".idx"
+
+def source_signature(source_path):
+    stat = os.stat(source_path)
+    return stat.st_size, stat.st_mtime_ns
+
+def build_name_index(source_path):
+    with open(source_path, encoding='utf-8') as f:
+        names = f.read().split("\n")
+    names = sorted(set(item.lower().encode("utf-8") for item in names if item != ""))
+
+    offsets = array("I", [0])
+    for name in names:
+        offsets.append(offsets[-1] + len(name))
+
+    size, mtime_ns = source_signature(source_path)
+    header = HEADER.pack(MAGIC, size, mtime_ns, len(names)).ljust(HEADER_SIZE, b"\0")
+
+    path = index_path(source_path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(offsets.tobytes())
+        f.write(b"".join(names))
+    os.replace(tmp_path, path)
+    return path
+
+def is_fresh(source_path):
+    path = index_path(source_path)
+    if not os.path.exists(path):
+        return False
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+    if len(header) != HEADER_SIZE:
+        return False
+    magic, size, mtime_ns, _ = HEADER.unpack(header[:HEADER.size])
+    return magic == MAGIC and (size, mtime_ns) == source_signature(source_path)
+
+class NameIndex:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _, _, _, self.size = HEADER.unpack(self.mm[:HEADER.size])
+        offsets_end = HEADER_SIZE + 4 * (self.size + 1)
+        self.offsets = memoryview(self.mm)[HEADER_SIZE:offsets_end].cast("I")
+        self.blob_start = offsets_end
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, idx):
+        if not 0 <= idx < self.size:
+            raise IndexError(idx)
+        return self.mm[self.blob_start + self.offsets[idx]:self.blob_start + self.offsets[idx + 1]]
+
+    def __contains__(self, name):
+        key = name.encode("utf-8")
+        idx = bisect.bisect_left(self, key)
+        return idx < self.size and self[idx] == key
+
+def load_name_index(source_path):
+    if not os.path.exists(source_path):
+        return frozenset()
+    if not is_fresh(source_path):
+        build_name_index(source_path)
+    return NameIndex(index_path(source_path))
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        return 0.0
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python name_index.py <name_file_path> [<name_file_path> ...]")
+        sys.exit(1)
+
+    for source_path in sys.argv[1:]:
+        if not os.path.exists(source_path):
+            print(f"File not found: {source_path}")
+            sys.exit(1)
+        start = time.perf_counter()
+        path = build_name_index(source_path)
+        print(f"{source_path} -> {path} ({len(NameIndex(path))} names, {time.perf_counter() - start:.3f}s)")
+
+if __name__ == "__main__":
+    main()
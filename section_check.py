@@ -1,9 +1,14 @@
 import sys
 import os
+import re
 import json
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
+import asyncio
+import argparse
 from tqdm import tqdm
-from util import client, extract_from_code_block, extract_json_from_str
+from util import async_client, extract_from_code_block, extract_json_from_str, json_parse_stats
+from cache import content_hash
+from loader import read_structure_data
 
 os.makedirs("./data", exist_ok=True)
 
@@ -23,116 +28,295 @@ section_check_prompt = '''Please read the input text and follow these instructio
 ]
 '''
 
+packed_section_check_prompt = '''The input text contains several sections. Each section starts with a line <section name="..."> and ends with a line </section>.
+Check every section independently and follow these instructions:
+1. Identify any errors including but not limited to spelling mistakes, inappropriate word usage, grammatical errors, and logical inconsistencies. 
+2. For each error found, provide a modification suggestion.
+3. Output should be in the format of "```json<output>```", where "<output>" is the placeholder. The output maps every section name to the list of errors found in that section, and sections without errors map to an empty list. An example is as follows:
 
-def check_by_llm(text):
-    global client, section_check_prompt
-    content = f"```input text\n{text}```"
-    completion = client.chat.completions.create(
+```json
+{
+    "<section name>": [
+        {
+            "type": "",
+            "sentence": "",
+            "description": "",
+            "suggestion": ""
+        }
+    ]
+}
+'''
+
+
+class AnswerFormatError(ValueError):
+    pass
+
+async def parse_answer(completion):
+    result = completion.choices[0].message.content
+    result_str_list = extract_from_code_block(result)
+    if not result_str_list:
+        raise AnswerFormatError("no code block in the answer")
+    result_json = await asyncio.to_thread(extract_json_from_str, result_str_list[0])
+    if result_json is None:
+        raise AnswerFormatError("the JSON in the answer could not be parsed")
+    return result_json
+
+async def parse_packed_answer(completion):
+    result_json = await parse_answer(completion)
+    if not isinstance(result_json, dict):
+        raise AnswerFormatError("the packed answer is not a JSON object keyed by section name")
+    return result_json
+
+async def request_section_check(content, use_cache=True):
+    global async_client, section_check_prompt
+    return await async_client.chat.completions.create_streamed(
         model="qwen-plus",
         messages=[
             {'role': 'system', 'content': section_check_prompt},
             {'role': 'user', 'content': content}
         ],
-        stream=False,
-        temperature=0.01
+        temperature=0.01,
+        use_cache=use_cache,
+        parse=parse_answer
     )
-    result = completion.choices[0].message.content
-    result_str_list = extract_from_code_block(result)
-    result_str = result_str_list[0]
-    result_json = extract_json_from_str(result_str)
-    return result_json
 
-def concatenate_values(structure):
-    result = []
-    if isinstance(structure, str):
-        result.append(structure)
-    if isinstance(structure, list):
-        if len(structure) != 0:
-            for v in structure:
-                result.append(concatenate_values(v))
-    if isinstance(structure, dict):
-        if len(structure.values()) != 0:
-            for v in structure.values():
-                result.append(concatenate_values(v))
-    result = [item for item in result if item is not None]
-    return "\n".join(result)
-
-def read_structure_data(json_path):
-    section_name_list = [
-        "title",
-        "abstract",
-        "introduction",
-        "related work",
-        "experiment",
-        "conclusion",
-        "limitation",
-        "appendix",
-        "checklist",
-        "image",
-        "table",
-    ]
-    with open(json_path, encoding='utf-8') as f:
-        json_data = json.load(f)
-    new_json_data = dict()
-    for key in json_data['structure'].keys():
-        for sn in section_name_list:
-            if sn in key.lower():
-                new_json_data[sn] = concatenate_values(json_data['structure'][key])
-    empty_key_list = []
-    for key in new_json_data.keys():
-        value_idx_list = new_json_data[key].split("\n")
-        value_list = []
-        for idx in value_idx_list:
-            if idx != "":
-                value_list.append(json_data['data'][idx])
-        new_json_data[key] = "\n".join(value_list)
-        if new_json_data[key] == "":
-            empty_key_list.append(key)
-    for key in empty_key_list:
-        new_json_data.pop(key)
-    if "related work" in new_json_data.keys():
-        new_json_data['related_work'] = new_json_data['related work']
-        new_json_data.pop("related work")
-    return new_json_data
+async def check_by_llm_async(text):
+    content = f"```input text\n{text}```"
+    try:
+        return await request_section_check(content)
+    except AnswerFormatError as exc:
+        print(f"{exc}, retrying without the cache")
+        return await request_section_check(content, use_cache=False)
 
+def estimate_tokens(text):
+    return (len(text) + 3) // 4
 
-def main():
-    if len(sys.argv) != 2:
-        print("Usage: python script.py <json_file_path>")
-        sys.exit(1)
+def split_paragraph(paragraph, max_tokens):
+    pieces = []
+    current = ""
+    for sentence in re.split(r'(?<=[.!?])\s+', paragraph):
+        candidate = f"{current} {sentence}" if current else sentence
+        if current and estimate_tokens(candidate) > max_tokens:
+            pieces.append(current)
+            candidate = sentence
+        current = candidate
+    if current:
+        pieces.append(current)
+    return pieces
 
-    file_path = sys.argv[1]
-    if not os.path.exists(file_path):
-        print(f"File not found: {file_path}")
-        sys.exit(1)
+def chunk_section(text, max_tokens):
+    if not max_tokens or estimate_tokens(text) <= max_tokens:
+        return [text]
+    chunks = []
+    current = []
+    current_tokens = 0
+    for paragraph in text.split("\n"):
+        pieces = [paragraph]
+        if estimate_tokens(paragraph) > max_tokens:
+            pieces = split_paragraph(paragraph, max_tokens)
+        for piece in pieces:
+            piece_tokens = estimate_tokens(piece) + 1
+            if current and current_tokens + piece_tokens > max_tokens:
+                chunks.append("\n".join(current))
+                current = []
+                current_tokens = 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
 
-    base_name = os.path.basename(file_path)
-    data = read_structure_data(file_path)
+def merge_results(result_list):
+    merged = []
+    for result_json in result_list:
+        if isinstance(result_json, list):
+            merged.extend(result_json)
+        elif result_json is not None:
+            merged.append(result_json)
+    return merged
+
+async def check_section_chunks(text, max_tokens):
+    chunks = chunk_section(text, max_tokens)
+    if len(chunks) == 1:
+        return await check_by_llm_async(text)
+    result_list = await asyncio.gather(*[check_by_llm_async(chunk) for chunk in chunks])
+    return merge_results(result_list)
 
-    section_check_report = "# Section Check Report\n\n"
+def pack_sections(data, max_tokens):
+    bins = []
+    bin_tokens = []
+    sizes = {key: estimate_tokens(data[key]) for key in data}
+    for key in sorted(sizes, key=lambda key: sizes[key], reverse=True):
+        if not max_tokens or sizes[key] > max_tokens:
+            bins.append([key])
+            bin_tokens.append(max_tokens)
+            continue
+        for idx in range(len(bins)):
+            if bin_tokens[idx] + sizes[key] <= max_tokens:
+                bins[idx].append(key)
+                bin_tokens[idx] += sizes[key]
+                break
+        else:
+            bins.append([key])
+            bin_tokens.append(sizes[key])
+    order = {key: idx for idx, key in enumerate(data)}
+    return [sorted(keys, key=order.get) for keys in bins]
 
-    with ThreadPoolExecutor(max_workers=4) as executor:
-        future_to_key = {executor.submit(check_by_llm, data[key]): key for key in data}
-        
-        for future in tqdm(as_completed(future_to_key), total=len(future_to_key)):
-            key = future_to_key[future]
+async def check_packed_by_llm_async(sections):
+    global async_client, packed_section_check_prompt
+    content = "\n".join(
+        f'<section name="{key}">\n{text}\n</section>' for key, text in sections.items()
+    )
+    result_json = await async_client.chat.completions.create_streamed(
+        model="qwen-plus",
+        messages=[
+            {'role': 'system', 'content': packed_section_check_prompt},
+            {'role': 'user', 'content': f"```input text\n{content}```"}
+        ],
+        temperature=0.01,
+        parse=parse_packed_answer
+    )
+    return {key: result_json[key] for key in sections if key in result_json}
+
+def section_hash(text):
+    global section_check_prompt
+    return content_hash(section_check_prompt, text)
+
+def format_section(key, result_json):
+    return "\n".join([
+        f"## {key}",
+        "result",
+        "```json",
+        json.dumps(result_json, indent=4),
+        "```"
+    ]) + "\n\n"
+
+def load_section_records(jsonl_path, data):
+    records = dict()
+    if not os.path.exists(jsonl_path):
+        return records
+    with open(jsonl_path, encoding='utf-8') as f:
+        for line in f:
             try:
-                result_json = future.result()
-                section_check_report += "\n".join([
-                    f"## {key}",
-                    "result",
-                    "```json",
-                    json.dumps(result_json, indent=4),
-                    "```"
-                ]) + "\n\n"
-            except Exception as exc:
-                print(f'Section {key} generated an exception: {exc}')
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            key = record.get("key")
+            if key in data and record.get("hash") == section_hash(data[key]):
+                records[key] = record
+    return records
+
+class SectionReportWriter:
+    def __init__(self, output_path, records=()):
+        self.md_file = open(output_path, 'w', encoding='utf-8')
+        self.jsonl_file = open(os.path.splitext(output_path)[0] + ".jsonl", 'w', encoding='utf-8')
+        self.md_file.write("# Section Check Report\n\n")
+        for record in records:
+            self.write(record)
+        self.flush()
+
+    def write(self, record):
+        self.md_file.write(format_section(record["key"], record["result"]))
+        self.jsonl_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def add(self, key, text, result_json):
+        self.write({"key": key, "hash": section_hash(text), "result": result_json})
+        self.flush()
+
+    def flush(self):
+        self.md_file.flush()
+        self.jsonl_file.flush()
+
+    def close(self):
+        self.md_file.close()
+        self.jsonl_file.close()
+
+async def check_sections(data, writer=None, max_tokens=None, pack_tokens=None):
+    async def check_section(key):
+        try:
+            return key, await check_section_chunks(data[key], max_tokens), None
+        except Exception as exc:
+            return key, None, exc
+
+    async def check_bin(keys):
+        if len(keys) == 1:
+            return [await check_section(keys[0])]
+        try:
+            results = await check_packed_by_llm_async({key: data[key] for key in keys})
+        except Exception as exc:
+            print(f'Sections {keys} generated an exception: {exc}')
+            results = dict()
+        missing = [key for key in keys if key not in results]
+        if missing:
+            print(f"packed response missed {missing}, checking them separately")
+        return [(key, results[key], None) for key in keys if key in results] + \
+            list(await asyncio.gather(*[check_section(key) for key in missing]))
+
+    start = time.perf_counter()
+    section_check_report = ""
+    bins = pack_sections(data, pack_tokens)
+    tasks = [asyncio.create_task(check_bin(keys)) for keys in bins]
+    print(f"{len(data)} sections in {len(bins)} requests")
+    with tqdm(total=len(data)) as pbar:
+        for future in asyncio.as_completed(tasks):
+            for key, result_json, exc in await future:
+                pbar.update(1)
+                if exc is not None:
+                    print(f'Section {key} generated an exception: {exc}')
+                    continue
+                if section_check_report == "":
+                    print(f"first section finished after {time.perf_counter() - start:.1f}s")
+                section_check_report += format_section(key, result_json)
+                if writer is not None:
+                    writer.add(key, data[key], result_json)
+    return "# Section Check Report\n\n" + section_check_report
+
+async def check_file(file_path, data=None, max_tokens=3000, pack_tokens=1500, resume=True, records_path=None):
+    base_name = os.path.basename(file_path)
+    if data is None:
+        data = read_structure_data(file_path)
 
     output_name = base_name.split(".")[0]+"_section.md"
     output_path = f"./data/{output_name}"
 
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(section_check_report)
+    records = dict()
+    if resume:
+        if records_path is None:
+            records_path = os.path.splitext(output_path)[0] + ".jsonl"
+        records = load_section_records(records_path, data)
+        if records:
+            print(f"resuming: {len(records)} of {len(data)} sections already checked")
+
+    writer = SectionReportWriter(output_path, records.values())
+    try:
+        await check_sections({key: data[key] for key in data if key not in records}, writer, max_tokens, pack_tokens)
+    finally:
+        writer.close()
+    return output_path
+
+def print_stats():
+    completions = async_client.chat.completions
+    if completions.hedge_percentile is not None:
+        print(f"hedges: {completions.hedges_fired} fired, {completions.hedges_won} won")
+    print("json parse: " + ", ".join(f"{path} {count}" for path, count in json_parse_stats.items()))
+
+def main():
+    parser = argparse.ArgumentParser(description="Section level check")
+    parser.add_argument("json_file_path")
+    parser.add_argument("--hedge-percentile", type=float, default=None, help="send a duplicate request to another endpoint once a request is slower than this latency percentile, e.g. 0.95")
+    parser.add_argument("--max-section-tokens", type=int, default=3000, help="split longer sections into chunks of about this many tokens at paragraph boundaries, 0 to disable")
+    parser.add_argument("--pack-tokens", type=int, default=1500, help="send sections smaller than this many tokens together in one request, 0 to disable")
+    parser.add_argument("--no-resume", action="store_true", help="recheck every section instead of reusing finished ones from the jsonl sidecar")
+    args = parser.parse_args()
+
+    file_path = args.json_file_path
+    if not os.path.exists(file_path):
+        print(f"File not found: {file_path}")
+        sys.exit(1)
+
+    async_client.chat.completions.hedge_percentile = args.hedge_percentile
+    asyncio.run(check_file(file_path, max_tokens=args.max_section_tokens, pack_tokens=args.pack_tokens, resume=not args.no_resume))
+    print_stats()
 
 if __name__ == "__main__":
     main()
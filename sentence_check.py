@@ -2,105 +2,183 @@ import sys
 import os
 import re
 import json
+import bisect
+import queue
+import unicodedata
+import importlib.metadata
+import urllib.parse
+import urllib.request
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from language_tool_python import LanguageTool
+from cache import DiskCache, content_hash
+from loader import read_structure_data
 
 os.makedirs("./data", exist_ok=True)
 
-def concatenate_values(structure):
-    result = []
-    if isinstance(structure, str):
-        result.append(structure)
-    if isinstance(structure, list):
-        if len(structure) != 0:
-            for v in structure:
-                result.append(concatenate_values(v))
-    if isinstance(structure, dict):
-        if len(structure.values()) != 0:
-            for v in structure.values():
-                result.append(concatenate_values(v))
-    result = [item for item in result if item is not None]
-    return "\n".join(result)
-
-def read_structure_data(json_path):
-    section_name_list = [
-        "title",
-        "abstract",
-        "introduction",
-        "related work",
-        "experiment",
-        "conclusion",
-        "limitation",
-        "appendix",
-        "checklist",
-        "image",
-        "table",
-    ]
-    with open(json_path, encoding='utf-8') as f:
-        json_data = json.load(f)
-    new_json_data = dict()
-    for key in json_data['structure'].keys():
-        for sn in section_name_list:
-            if sn in key.lower():
-                new_json_data[sn] = concatenate_values(json_data['structure'][key])
-    empty_key_list = []
-    for key in new_json_data.keys():
-        value_idx_list = new_json_data[key].split("\n")
-        value_list = []
-        for idx in value_idx_list:
-            if idx != "":
-                value_list.append(json_data['data'][idx])
-        new_json_data[key] = "\n".join(value_list)
-        if new_json_data[key] == "":
-            empty_key_list.append(key)
-    for key in empty_key_list:
-        new_json_data.pop(key)
-    if "related work" in new_json_data.keys():
-        new_json_data['related_work'] = new_json_data['related work']
-        new_json_data.pop("related work")
-    return new_json_data
+sentence_separator = "\n\n"
+cross_sentence_rules = (
+    "ENGLISH_WORD_REPEAT_BEGINNING_RULE",
+    "WORD_REPEAT_BEGINNING_RULE",
+    "PARAGRAPH_REPEAT_BEGINNING_RULE",
+    "EN_REPEATEDWORDS",
+    "STYLE_REPEATED_WORD_RULE",
+    "EN_WORD_COHERENCY",
+    "EN_UNPAIRED_BRACKETS",
+    "EN_UNPAIRED_QUOTES",
+)
 
+def is_cross_sentence_rule(rule_id):
+    return rule_id.startswith(cross_sentence_rules)
 
+def batch_sentences(sentences, idx_list, batch_chars=5000):
+    batch = []
+    batch_len = 0
+    for idx in idx_list:
+        sentence = sentences[idx]
+        if batch and batch_len + len(sentence) > batch_chars:
+            yield batch
+            batch = []
+            batch_len = 0
+        batch.append(idx)
+        batch_len += len(sentence) + len(sentence_separator)
+    if batch:
+        yield batch
 
-def main():
-    if len(sys.argv) != 2:
-        print("Usage: python script.py <json_file_path>")
-        sys.exit(1)
+def check_batch(tool, sentences, idx_list):
+    text = sentence_separator.join(sentences[idx] for idx in idx_list)
+    start_list = []
+    start = 0
+    for idx in idx_list:
+        start_list.append(start)
+        start += len(sentences[idx]) + len(sentence_separator)
 
-    file_path = sys.argv[1]
-    if not os.path.exists(file_path):
-        print(f"File not found: {file_path}")
-        sys.exit(1)
+    result = {idx: [] for idx in idx_list}
+    for m in tool.check(text):
+        if is_cross_sentence_rule(m.ruleId):
+            continue
+        pos = bisect.bisect_right(start_list, m.offset) - 1
+        idx = idx_list[pos]
+        end = start_list[pos] + len(sentences[idx])
+        if m.offset >= end or m.offset + m.errorLength > end:
+            continue
+        result[idx].append({"ruleId": m.ruleId, "message": m.message, "replacements": m.replacements})
+    return result
 
-    base_name = os.path.basename(file_path)
-    data = read_structure_data(file_path)
+def query_server_version(url, language):
+    data = urllib.parse.urlencode({"text": ".", "language": language}).encode()
+    with urllib.request.urlopen(urllib.parse.urljoin(url, "check"), data=data, timeout=30) as response:
+        software = json.load(response)["software"]
+    return f"{software['version']} {software.get('buildDate', '')}".strip()
 
-    sentences = []
-    abbreviation = ["e.g.", "et al.", "i.e.", "Fig.", "Tab.", "Sec."]
-    for section in data.values():
-        for av in abbreviation:
-            section = section.replace(av, "")
-        lines = re.split(r'(?<=[.!?])\s+', section)
-        sentences.extend(re.split(r'(?<=[.!?])\s+', section))
-    sentences = [item for item in sentences if item != ""]
+class LanguageToolPool:
+    def __init__(self, language='en-US', servers=1, workers=None, remote_server=None):
+        self.language = language
+        self.workers = workers or os.cpu_count() or 1
+        if remote_server:
+            self.tools = [LanguageTool(language, remote_server=remote_server)]
+        else:
+            with ThreadPoolExecutor(max_workers=servers) as executor:
+                self.tools = list(executor.map(lambda _: LanguageTool(language), range(servers)))
+        for tool in self.tools:
+            tool.disabled_rules = set(getattr(tool, "disabled_rules", None) or ()) | set(cross_sentence_rules)
+        self.slots = queue.Queue()
+        for i in range(self.workers):
+            self.slots.put(self.tools[i % len(self.tools)])
+        self.version = None
 
-    output_name = base_name.split(".")[0]+"_sentences.json"
-    output_path = f"./data/{output_name}"
-    with open(output_path, 'w', encoding="utf-8") as f:
-        json.dump(sentences, f, indent=4)
+    def server_version(self):
+        if self.version is None:
+            url = getattr(self.tools[0], "_url", None)
+            if url is None:
+                return None
+            try:
+                self.version = query_server_version(url, self.language)
+            except (OSError, ValueError, KeyError) as exc:
+                print(f"could not query the LanguageTool server version: {exc}")
+        return self.version
+
+    def config_key(self):
+        tool = self.tools[0]
+        server_version = self.server_version()
+        if server_version is None:
+            return None
+        try:
+            package_version = importlib.metadata.version("language_tool_python")
+        except importlib.metadata.PackageNotFoundError:
+            package_version = None
+        return json.dumps({
+            "package_version": package_version,
+            "server_version": server_version,
+            "language": self.language,
+            "disabled_rules": sorted(getattr(tool, "disabled_rules", None) or []),
+            "enabled_rules": sorted(getattr(tool, "enabled_rules", None) or []),
+            "enabled_rules_only": getattr(tool, "enabled_rules_only", False),
+            "disabled_categories": sorted(getattr(tool, "disabled_categories", None) or []),
+            "enabled_categories": sorted(getattr(tool, "enabled_categories", None) or []),
+            "sentence_separator": sentence_separator,
+            "cross_sentence_rules": list(cross_sentence_rules),
+        }, sort_keys=True)
+
+    def check_batch(self, sentences, idx_list):
+        tool = self.slots.get()
+        try:
+            return check_batch(tool, sentences, idx_list)
+        finally:
+            self.slots.put(tool)
+
+    def close(self):
+        for tool in self.tools:
+            tool.close()
+
+def check_sentences(pool, sentences, batch_chars=5000, cache=None):
+    result = dict()
+    if cache is not None:
+        config_key = pool.config_key()
+        if config_key is None:
+            print("sentence cache disabled: unknown LanguageTool server version")
+            cache = None
+    if cache is not None:
+        key_list = [content_hash(config_key, unicodedata.normalize("NFC", sentence)) for sentence in sentences]
+        cached = cache.get_many(key_list)
+        for idx, key in enumerate(key_list):
+            if key in cached:
+                result[idx] = cached[key]
+    todo_idx_list = [idx for idx in range(len(sentences)) if idx not in result]
 
-    tool = LanguageTool('en-US')
+    with ThreadPoolExecutor(max_workers=pool.workers) as executor:
+        futures = [
+            executor.submit(pool.check_batch, sentences, idx_list)
+            for idx_list in batch_sentences(sentences, todo_idx_list, batch_chars)
+        ]
+        for future in as_completed(futures):
+            result.update(future.result())
 
+    if cache is not None:
+        cache.set_many({key_list[idx]: result[idx] for idx in todo_idx_list})
+        print(f"sentence cache: {len(sentences) - len(todo_idx_list)} hits, {len(todo_idx_list)} misses")
+    return [result[idx] for idx in range(len(sentences))]
+
+def split_text(text):
+    abbreviation = ["e.g.", "et al.", "i.e.", "Fig.", "Tab.", "Sec."]
+    for av in abbreviation:
+        text = text.replace(av, "")
+    return [item for item in re.split(r'(?<=[.!?])\s+', text) if item != ""]
+
+def split_sentences(data):
+    sentences = []
+    for section in data.values():
+        sentences.extend(split_text(section))
+    return sentences
+
+def format_sentence_report(sentences, matches_list):
     sentences_report = "# Sentence Check\n\n"
 
-    for idx, sentence in enumerate(sentences):
-        matches = tool.check(sentence)
+    for idx, (sentence, matches) in enumerate(zip(sentences, matches_list)):
         if matches:
             error = {
                 'sentence': sentence,
-                'error': [
-                    {"ruleId": m.ruleId, "message": m.message, "replacements": m.replacements} 
-                    for m in matches
-                ]
+                'error': matches
             }
             sentences_report += "\n".join([
                 f"error: {idx} sentence",
@@ -108,11 +186,87 @@ def main():
                 json.dumps(error, indent=4),
                 "```"
             ]) + "\n"
+    return sentences_report
+
+def write_sentence_reports(file_path, sentences, matches_list):
+    base_name = os.path.basename(file_path)
+    output_name = base_name.split(".")[0]+"_sentences.json"
+    output_path = f"./data/{output_name}"
+    with open(output_path, 'w', encoding="utf-8") as f:
+        json.dump(sentences, f, indent=4)
 
     output_name = base_name.split(".")[0]+"_sentence.md"
     output_path = f"./data/{output_name}"
     with open(output_path, 'w', encoding="utf-8") as f:
-        f.write(sentences_report)
+        f.write(format_sentence_report(sentences, matches_list))
+    return output_path
+
+def run_sentences(sentences, batch_chars=5000, servers=1, workers=None, remote_server=None, cache_path="./cache/sentence.sqlite"):
+    pool = LanguageToolPool('en-US', servers=servers, workers=workers, remote_server=remote_server)
+    try:
+        cache = DiskCache(cache_path, max_entries=500000) if cache_path else None
+        return check_sentences(pool, sentences, batch_chars, cache)
+    finally:
+        pool.close()
+
+def check_file(file_path, data=None, batch_chars=5000, servers=1, workers=None, remote_server=None, cache_path="./cache/sentence.sqlite"):
+    if data is None:
+        data = read_structure_data(file_path)
+
+    sentences = split_sentences(data)
+    matches_list = run_sentences(sentences, batch_chars, servers, workers, remote_server, cache_path)
+    return write_sentence_reports(file_path, sentences, matches_list)
+
+def check_file_incremental(file_path, document, previous=None, dirty_ids=(), batch_chars=5000, servers=1, workers=None, remote_server=None, cache_path="./cache/sentence.sqlite"):
+    previous = previous or dict()
+    dirty_ids = set(dirty_ids)
+    results = dict()
+    todo_sentences = []
+    todo_owners = []
+    for ids in document.sections.values():
+        for idx in ids:
+            if idx in results:
+                continue
+            if idx in previous and idx not in dirty_ids:
+                results[idx] = previous[idx]
+                continue
+            results[idx] = []
+            for sentence in split_text(document.paragraphs[idx]):
+                todo_sentences.append(sentence)
+                todo_owners.append(idx)
+    print(f"sentence check: {len(set(todo_owners))} of {len(results)} paragraphs to check, {len(todo_sentences)} sentences")
+
+    if todo_sentences:
+        matches_list = run_sentences(todo_sentences, batch_chars, servers, workers, remote_server, cache_path)
+        for idx, sentence, matches in zip(todo_owners, todo_sentences, matches_list):
+            results[idx].append([sentence, matches])
+
+    sentences = []
+    matches_list = []
+    for ids in document.sections.values():
+        for idx in ids:
+            for sentence, matches in results[idx]:
+                sentences.append(sentence)
+                matches_list.append(matches)
+    return write_sentence_reports(file_path, sentences, matches_list), results
+
+def main():
+    parser = argparse.ArgumentParser(description="Sentence level check")
+    parser.add_argument("json_file_path")
+    parser.add_argument("--batch-chars", type=int, default=5000, help="max characters per LanguageTool request, 0 checks one sentence per request")
+    parser.add_argument("--servers", type=int, default=1, help="number of local LanguageTool servers to start")
+    parser.add_argument("--workers", type=int, default=None, help="number of concurrent LanguageTool requests (default: cpu count)")
+    parser.add_argument("--remote-server", default=None, help="url of a running LanguageTool server to use instead of local ones")
+    parser.add_argument("--cache-path", default="./cache/sentence.sqlite", help="sentence result cache, empty string disables it")
+    args = parser.parse_args()
+
+    file_path = args.json_file_path
+    if not os.path.exists(file_path):
+        print(f"File not found: {file_path}")
+        sys.exit(1)
+
+    check_file(file_path, batch_chars=args.batch_chars, servers=args.servers, workers=args.workers,
+               remote_server=args.remote_server, cache_path=args.cache_path)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,6 @@
+import os
+import sys
+
+os.environ.setdefault("DEEPSEEK_API_KEY", "test")
+os.environ.setdefault("BAILIAN_API_KEY", "test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,105 @@
+import json
+import time
+import socket
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, body):
+        body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("x-should-retry", "false")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_chunk(self, model, content, finish_reason=None):
+        chunk = {
+            "id": "stub", "object": "chat.completion.chunk", "created": 0, "model": model,
+            "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": finish_reason}],
+        }
+        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        self.wfile.flush()
+
+    def do_POST(self):
+        stub = self.server.stub
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        with stub.lock:
+            stub.requests += 1
+            stub.active += 1
+            stub.max_active = max(stub.max_active, stub.active)
+        try:
+            self.answer(stub, request)
+        finally:
+            with stub.lock:
+                stub.active -= 1
+
+    def answer(self, stub, request):
+        time.sleep(stub.delay)
+        if stub.status != 200:
+            self.send_json(stub.status, {"error": {"message": f"stub error {stub.status}", "type": "stub"}})
+            return
+        content = stub.next_content()
+        if not request.get("stream"):
+            self.send_json(200, {
+                "id": "stub", "object": "chat.completion", "created": 0, "model": request["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            })
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        pieces = [content[i:i + 8] for i in range(0, len(content), 8)]
+        for i, piece in enumerate(pieces):
+            time.sleep(stub.chunk_delay)
+            if stub.break_stream and i > 0:
+                return
+            self.send_chunk(request["model"], piece, "stop" if i == len(pieces) - 1 else None)
+        self.wfile.write(b"data: [DONE]\n\n")
+
+class StubEndpoint:
+    def __init__(self, content="ok", delay=0.0, chunk_delay=0.0, status=200, break_stream=False):
+        self.content = content
+        self.delay = delay
+        self.chunk_delay = chunk_delay
+        self.status = status
+        self.break_stream = break_stream
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.answered = 0
+        self.active = 0
+        self.max_active = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.server.daemon_threads = True
+        self.server.stub = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def next_content(self):
+        with self.lock:
+            if isinstance(self.content, str):
+                return self.content
+            self.answered += 1
+            return self.content[min(self.answered, len(self.content)) - 1]
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_port}/v1"
+
+    def config(self, model, **options):
+        return {"api_key": "test", "base_url": self.base_url, "model": model, **options}
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def closed_port_url():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}/v1"
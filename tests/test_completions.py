@@ -0,0 +1,120 @@
+import asyncio
+import time
+
+import openai
+import pytest
+
+from util import CompletionsWrapper, AsyncCompletionsWrapper
+from stub_server import StubEndpoint, closed_port_url
+
+messages = [{"role": "user", "content": "check this"}]
+
+
+@pytest.fixture
+def stubs():
+    started = []
+
+    def start(**options):
+        stub = StubEndpoint(**options)
+        started.append(stub)
+        return stub
+    yield start
+    for stub in started:
+        stub.close()
+
+def answer(completion):
+    return completion.choices[0].message.content
+
+def test_server_error_fails_over(stubs):
+    broken, healthy = stubs(status=500), stubs(content="healthy")
+    wrapper = CompletionsWrapper([broken.config("a"), healthy.config("b")])
+    assert answer(wrapper.create(model="a", messages=messages)) == "healthy"
+    assert broken.requests == 1
+    assert wrapper.state_list[0].failures == 1
+    assert [state.outstanding for state in wrapper.state_list] == [0, 0]
+
+def test_rate_limit_fails_over(stubs):
+    limited, healthy = stubs(status=429), stubs(content="healthy")
+    wrapper = AsyncCompletionsWrapper([limited.config("a"), healthy.config("b")])
+    assert answer(asyncio.run(wrapper.create(model="a", messages=messages))) == "healthy"
+    assert wrapper.state_list[0].failures == 1
+
+def test_connection_error_fails_over(stubs):
+    healthy = stubs(content="healthy")
+    config = {"api_key": "test", "base_url": closed_port_url(), "model": "a"}
+    wrapper = AsyncCompletionsWrapper([config, healthy.config("b")])
+    assert answer(asyncio.run(wrapper.create(model="a", messages=messages))) == "healthy"
+    assert wrapper.state_list[0].failures == 1
+
+@pytest.mark.parametrize("status, error", [
+    (400, openai.BadRequestError),
+    (401, openai.AuthenticationError),
+    (404, openai.NotFoundError),
+])
+def test_client_error_is_raised_without_failover(stubs, status, error):
+    rejecting, healthy = stubs(status=status), stubs()
+    sync_wrapper = CompletionsWrapper([rejecting.config("a"), healthy.config("b")])
+    async_wrapper = AsyncCompletionsWrapper([rejecting.config("a"), healthy.config("b")])
+    with pytest.raises(error):
+        sync_wrapper.create(model="a", messages=messages)
+    with pytest.raises(error):
+        asyncio.run(async_wrapper.create(model="a", messages=messages))
+    assert rejecting.requests == 2
+    assert healthy.requests == 0
+    for wrapper in (sync_wrapper, async_wrapper):
+        assert wrapper.state_list[0].failures == 0
+        assert wrapper.state_list[0].ejected_until == 0.0
+        assert [state.outstanding for state in wrapper.state_list] == [0, 0]
+
+def test_failing_endpoint_is_ejected(stubs):
+    broken, healthy = stubs(status=503), stubs()
+    wrapper = CompletionsWrapper([broken.config("a"), healthy.config("b")], max_failures=2, eject_seconds=60)
+    for _ in range(6):
+        wrapper.create(model="a", messages=messages)
+    assert broken.requests == 2
+    assert wrapper.state_list[0].ejected_until > time.monotonic()
+
+def test_broken_stream_fails_over(stubs):
+    broken, healthy = stubs(content="x" * 40, break_stream=True), stubs(content="complete answer")
+    wrapper = AsyncCompletionsWrapper([broken.config("a"), healthy.config("b")])
+    completion = asyncio.run(wrapper.create_streamed(model="a", messages=messages))
+    assert answer(completion) == "complete answer"
+    assert completion.choices[0].finish_reason == "stop"
+    assert wrapper.state_list[0].failures == 1
+
+def test_stream_holds_endpoint_slot(stubs):
+    slow = stubs(content="x" * 40, chunk_delay=0.05)
+    wrapper = AsyncCompletionsWrapper([slow.config("a", max_concurrency=2)])
+
+    async def run():
+        return await asyncio.gather(*[wrapper.create_streamed(model="a", messages=messages) for _ in range(6)])
+    completions = asyncio.run(run())
+    assert [answer(completion) for completion in completions] == ["x" * 40] * 6
+    assert slow.max_active == 2
+    assert wrapper.state_list[0].latency >= 0.2
+    assert wrapper.state_list[0].outstanding == 0
+
+def test_hedge_races_whole_stream(stubs):
+    slow = stubs(content="slow answer " * 4, chunk_delay=0.5)
+    fast = stubs(content="fast answer")
+    wrapper = AsyncCompletionsWrapper(
+        [slow.config("a"), fast.config("b")],
+        hedge_percentile=0.95, hedge_default_delay=0.2
+    )
+    start = time.monotonic()
+    completion = asyncio.run(wrapper.create_streamed(model="a", messages=messages))
+    assert answer(completion) == "fast answer"
+    assert time.monotonic() - start < 1.5
+    assert (wrapper.hedges_fired, wrapper.hedges_won) == (1, 1)
+    assert [state.outstanding for state in wrapper.state_list] == [0, 0]
+
+def test_wrapper_survives_a_new_event_loop(stubs):
+    slow = stubs(content="answer", delay=0.05)
+    wrapper = AsyncCompletionsWrapper([slow.config("a", max_concurrency=1, rate_limit=100)])
+
+    async def run():
+        return await asyncio.gather(*[wrapper.create_streamed(model="a", messages=messages) for _ in range(4)])
+    for _ in range(3):
+        assert [answer(completion) for completion in asyncio.run(run())] == ["answer"] * 4
+    assert slow.requests == 12
+    assert slow.max_active == 1
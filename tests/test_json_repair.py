@@ -0,0 +1,36 @@
+import pytest
+
+import util
+from util import repair_json, extract_json_from_str
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('[{"a": 1,},]', [{"a": 1}]),
+    ("{'a': True, 'b': None}", {"a": True, "b": None}),
+    ('{a: "x", b: [1, 2', {"a": "x", "b": [1, 2]}),
+    ('{"a": "say "hi" now"}', {"a": 'say "hi" now'}),
+    ('{"a": "中文"} // comment', {"a": "中文"}),
+    ('{"a": “quoted”}', {"a": "quoted"}),
+    ('{état: 1}', {"état": 1}),
+])
+def test_repair_json(text, expected):
+    assert repair_json(text) == expected
+
+@pytest.fixture
+def llm_reformat(monkeypatch):
+    calls = []
+
+    def reformat(text):
+        calls.append(text)
+        return []
+    monkeypatch.setattr(util, "reformat_json_multi_round", reformat)
+    return calls
+
+@pytest.mark.parametrize("text", ['[{"a": "中"} 中]', '[é]', '{"a": 1} é'])
+def test_unrepairable_json_falls_through_to_llm(llm_reformat, text):
+    assert extract_json_from_str(text) == []
+    assert llm_reformat == [text]
+
+def test_repaired_json_skips_llm(llm_reformat):
+    assert extract_json_from_str('```json\n[{"a": 1,}]\n```') == [{"a": 1}]
+    assert llm_reformat == []
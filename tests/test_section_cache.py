@@ -0,0 +1,65 @@
+import asyncio
+import json
+
+import pytest
+
+import section_check
+from cache import DiskCache
+from util import AsyncClientWrapper
+from stub_server import StubEndpoint
+
+good_answer = "```json\n" + json.dumps([{"type": "spelling", "sentence": "teh", "description": "", "suggestion": "the"}]) + "\n```"
+
+
+@pytest.fixture
+def llm(monkeypatch, tmp_path):
+    stubs = []
+
+    def start(content):
+        stub = StubEndpoint(content=content)
+        stubs.append(stub)
+        client = AsyncClientWrapper([stub.config("a")], cache=DiskCache(str(tmp_path / "llm.sqlite")))
+        monkeypatch.setattr(section_check, "async_client", client)
+        return stub, client.chat.completions.cache
+    yield start
+    for stub in stubs:
+        stub.close()
+
+def test_answer_is_cached_after_it_parses(llm):
+    stub, cache = llm(good_answer)
+    assert asyncio.run(section_check.check_by_llm_async("teh text"))[0]["suggestion"] == "the"
+    assert asyncio.run(section_check.check_by_llm_async("teh text"))[0]["suggestion"] == "the"
+    assert stub.requests == 1
+    assert len(cache) == 1
+
+def test_answer_without_code_block_is_retried_and_not_cached(llm):
+    stub, cache = llm(["Looks fine to me.", good_answer])
+    assert asyncio.run(section_check.check_by_llm_async("teh text"))[0]["suggestion"] == "the"
+    assert stub.requests == 2
+    assert len(cache) == 0
+
+def test_unparseable_cached_answer_is_evicted(llm):
+    stub, cache = llm(good_answer)
+    completions = section_check.async_client.chat.completions
+    key = completions.cache_key({
+        "model": "qwen-plus",
+        "messages": [
+            {'role': 'system', 'content': section_check.section_check_prompt},
+            {'role': 'user', 'content': "```input text\nteh text```"}
+        ],
+        "temperature": 0.01,
+        "stream": False,
+    })
+    cache.set(key, {
+        "id": "old", "object": "chat.completion", "created": 0, "model": "a",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "garbled"}}],
+    })
+    assert asyncio.run(section_check.check_by_llm_async("teh text"))[0]["suggestion"] == "the"
+    assert stub.requests == 1
+    assert len(cache) == 0
+
+def test_packed_answer_that_is_not_an_object_is_not_cached(llm):
+    stub, cache = llm("```json\n[]\n```")
+    with pytest.raises(section_check.AnswerFormatError):
+        asyncio.run(section_check.check_packed_by_llm_async({"title": "A", "abstract": "B"}))
+    assert len(cache) == 0
@@ -0,0 +1,162 @@
+import os
+import re
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+pytest.importorskip("language_tool_python")
+
+import sentence_check
+from cache import DiskCache
+from sentence_check import check_batch, check_sentences, LanguageToolPool
+
+
+class Match:
+    def __init__(self, ruleId, offset, errorLength):
+        self.ruleId = ruleId
+        self.offset = offset
+        self.errorLength = errorLength
+        self.message = ruleId
+        self.replacements = []
+
+class PatternTool:
+    rules = {
+        "MORFOLOGIK_RULE_EN_US": r"teh",
+        "ENGLISH_WORD_REPEAT_RULE": r"\b(\w+) \1\b",
+        "SPANNING_RULE": r"end\.\s+Start",
+        "SEPARATOR_RULE": r"\n\n",
+    }
+
+    def __init__(self, language="en-US", remote_server=None):
+        self.disabled_rules = set()
+
+    def check(self, text):
+        matches = []
+        for rule_id, pattern in self.rules.items():
+            for m in re.finditer(pattern, text):
+                matches.append(Match(rule_id, m.start(), m.end() - m.start()))
+        return sorted(matches, key=lambda m: m.offset)
+
+    def close(self):
+        pass
+
+class ContextTool(PatternTool):
+    def check(self, text):
+        matches = super().check(text)
+        paragraphs = []
+        start = 0
+        for paragraph in text.split("\n\n"):
+            paragraphs.append((start, paragraph))
+            start += len(paragraph) + 2
+        first_words = [paragraph.split(" ")[0] for _, paragraph in paragraphs]
+        for i, (start, paragraph) in enumerate(paragraphs):
+            if i > 0 and first_words[i] == first_words[i - 1]:
+                matches.append(Match("ENGLISH_WORD_REPEAT_BEGINNING_RULE", start, len(first_words[i])))
+        model_offsets = [m.start() for m in re.finditer(r"\bmodel\b", text)]
+        for offset in model_offsets[1:]:
+            matches.append(Match("EN_REPEATEDWORDS_MODEL", offset, 5))
+        matches = [m for m in matches if m.ruleId not in self.disabled_rules]
+        return sorted(matches, key=lambda m: m.offset)
+
+def rule_ids(result):
+    return {idx: [match["ruleId"] for match in matches] for idx, matches in result.items()}
+
+context_sentences = [
+    "The model is trained.",
+    "The model converges.",
+    "We use teh same same data.",
+    "We report results.",
+    "Start here.",
+]
+
+def test_matches_are_mapped_to_their_sentence():
+    sentences = ["This is teh first.", "It ends at the end.", "Start with with a repeat.", "Clean."]
+    result = check_batch(PatternTool(), sentences, [0, 1, 2, 3])
+    assert rule_ids(result) == {
+        0: ["MORFOLOGIK_RULE_EN_US"],
+        1: [],
+        2: ["ENGLISH_WORD_REPEAT_RULE"],
+        3: [],
+    }
+
+def test_context_rules_fire_only_in_batches():
+    context_rules = {"ENGLISH_WORD_REPEAT_BEGINNING_RULE", "EN_REPEATEDWORDS_MODEL"}
+    batched = ContextTool().check(sentence_check.sentence_separator.join(context_sentences))
+    single = [m for sentence in context_sentences for m in ContextTool().check(sentence)]
+    assert context_rules <= {m.ruleId for m in batched}
+    assert not context_rules & {m.ruleId for m in single}
+
+def test_batched_report_equals_single_sentence_report(monkeypatch):
+    monkeypatch.setattr(sentence_check, "LanguageTool", ContextTool)
+    pool = LanguageToolPool()
+    batched = check_sentences(pool, context_sentences, batch_chars=5000)
+    single = check_sentences(pool, context_sentences, batch_chars=0)
+    assert batched == single
+    assert [[match["ruleId"] for match in matches] for matches in batched] == [
+        [], [], ["MORFOLOGIK_RULE_EN_US", "ENGLISH_WORD_REPEAT_RULE"], [], []
+    ]
+
+@pytest.mark.skipif(not os.environ.get("LANGUAGETOOL_URL"), reason="set LANGUAGETOOL_URL to a running LanguageTool server")
+def test_batched_report_equals_single_sentence_report_on_server():
+    sentences = [
+        "This is is a sentence with a repeated word.",
+        "Teh results are shown in table 1.",
+        "The model performs well.",
+        "The model is trained on a large corpus.",
+        "The model converges quickly (see the appendix.",
+        "We use a an optimizer with momentum).",
+        "their is no difference between the e-mail and email runs.",
+    ]
+    pool = LanguageToolPool(remote_server=os.environ["LANGUAGETOOL_URL"])
+    try:
+        assert check_sentences(pool, sentences, batch_chars=5000) == check_sentences(pool, sentences, batch_chars=0)
+    finally:
+        pool.close()
+
+class VersionHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps({
+            "software": {"name": "LanguageTool", "version": self.server.version, "buildDate": "2024-01-01"},
+            "matches": [],
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class RemoteTool(PatternTool):
+    def __init__(self, language, remote_server=None):
+        super().__init__(language, remote_server)
+        if remote_server is not None:
+            self._url = remote_server + "/v2/"
+
+@pytest.fixture
+def version_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), VersionHandler)
+    server.version = "6.4"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_cache_key_uses_reported_server_version(monkeypatch, version_server):
+    monkeypatch.setattr(sentence_check, "LanguageTool", RemoteTool)
+    url = f"http://127.0.0.1:{version_server.server_port}"
+    pool = LanguageToolPool(remote_server=url)
+    assert pool.server_version() == "6.4 2024-01-01"
+    version_server.version = "6.5"
+    assert LanguageToolPool(remote_server=url).config_key() != pool.config_key()
+
+def test_cache_is_skipped_without_server_version(monkeypatch, tmp_path):
+    monkeypatch.setattr(sentence_check, "LanguageTool", RemoteTool)
+    pool = LanguageToolPool()
+    cache = DiskCache(str(tmp_path / "sentence.sqlite"))
+    assert check_sentences(pool, ["teh cat.", "Fine."], cache=cache)[0][0]["ruleId"] == "MORFOLOGIK_RULE_EN_US"
+    assert len(cache) == 0
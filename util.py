@@ -1,5 +1,10 @@
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI, APIConnectionError, APIStatusError
+from openai.types.chat import ChatCompletion
+from cache import DiskCache, content_hash
 import threading
+import asyncio
+import time
+from collections import deque
 import os
 import re
 import json
@@ -10,43 +15,385 @@ config_list = [
 ]
 
 class APIWrapper:
-    def __init__(self, api_key, base_url, model):
+    def __init__(self, api_key, base_url, model, max_concurrency=4, rate_limit=None):
         self.client = OpenAI(api_key=api_key, base_url=base_url)
         self.model = model
+        self.max_concurrency = max_concurrency
+        self.rate_limit = rate_limit
     
     def create(self, *args, **kwargs):
         print(f"you are using {self.model}")
         kwargs.pop('model', None)
         return self.client.chat.completions.create(model=self.model, *args, **kwargs)
-         
+
+class LoopLocal:
+    def __init__(self, factory):
+        self.factory = factory
+        self.loop = None
+        self.value = None
+
+    def get(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            self.loop = loop
+            self.value = self.factory()
+        return self.value
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate or 0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = LoopLocal(asyncio.Lock)
+
+    async def acquire(self):
+        if not self.rate:
+            return
+        async with self.lock.get():
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class StreamInterruptedError(Exception):
+    pass
+
+def is_endpoint_error(exc):
+    if isinstance(exc, APIStatusError):
+        return exc.status_code == 429 or exc.status_code >= 500
+    return isinstance(exc, (APIConnectionError, StreamInterruptedError, TimeoutError))
+
+async def assemble_stream(stream, model):
+    content = []
+    finish_reason = None
+    chunk = None
+    try:
+        async for chunk in stream:
+            if chunk.choices:
+                if chunk.choices[0].delta.content:
+                    content.append(chunk.choices[0].delta.content)
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+    except Exception as exc:
+        raise StreamInterruptedError(f"stream from {model} interrupted: {exc}") from exc
+    finally:
+        await stream.close()
+    if finish_reason is None:
+        raise StreamInterruptedError(f"stream from {model} ended before the last chunk")
+    return ChatCompletion.model_validate({
+        "id": chunk.id if chunk else "",
+        "object": "chat.completion",
+        "created": chunk.created if chunk else int(time.time()),
+        "model": chunk.model if chunk else model,
+        "choices": [{
+            "index": 0,
+            "finish_reason": finish_reason,
+            "message": {"role": "assistant", "content": "".join(content)},
+        }],
+    })
+
+class AsyncAPIWrapper:
+    def __init__(self, api_key, base_url, model, max_concurrency=4, rate_limit=None):
+        self.client = LoopLocal(lambda: AsyncOpenAI(api_key=api_key, base_url=base_url))
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.rate_limit = rate_limit
+        self.semaphore = LoopLocal(lambda: asyncio.Semaphore(max_concurrency))
+        self.bucket = TokenBucket(rate_limit)
+
+    async def create(self, *args, **kwargs):
+        async with self.semaphore.get():
+            await self.bucket.acquire()
+            print(f"you are using {self.model}")
+            kwargs.pop('model', None)
+            response = await self.client.get().chat.completions.create(model=self.model, *args, **kwargs)
+            if kwargs.get("stream"):
+                return await assemble_stream(response, self.model)
+            return response
+
+class EndpointState:
+    def __init__(self):
+        self.outstanding = 0
+        self.latency = None
+        self.failures = 0
+        self.ejected_until = 0.0
 
 class CompletionsWrapper:
-    def __init__(self, config_list):
+    api_wrapper = APIWrapper
+
+    def __init__(self, config_list, cache=None, max_failures=3, eject_seconds=30.0, latency_alpha=0.3):
         self.client_list = [
-            APIWrapper(**config)
+            self.api_wrapper(**config)
             for config in config_list
         ]
         self.client_num = len(self.client_list)
+        self.state_list = [EndpointState() for _ in self.client_list]
         self.visit_num = 0
         self.lock = threading.Lock()
-    
-    def create(self, *args, **kwargs):
+        self.cache = cache
+        self.endpoint_models = sorted(config["model"] for config in config_list)
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self.latency_alpha = latency_alpha
+        self.latency_history = deque(maxlen=200)
+
+    def score(self, index):
+        state = self.state_list[index]
+        return (
+            (state.outstanding + 1) * (state.latency or 0.0),
+            state.outstanding,
+            (index - self.visit_num) % self.client_num,
+        )
+
+    def has_capacity(self, index):
+        return self.state_list[index].outstanding < self.client_list[index].max_concurrency
+
+    def select_client(self, exclude=(), require_capacity=False):
+        now = time.monotonic()
         with self.lock:
-            current_client_index = self.visit_num % self.client_num
+            candidates = [i for i in range(self.client_num) if i not in exclude]
+            healthy = [i for i in candidates if self.state_list[i].ejected_until <= now]
+            if healthy:
+                if require_capacity:
+                    healthy = [i for i in healthy if self.has_capacity(i)]
+                    if not healthy:
+                        return None
+                index = min(healthy, key=self.score)
+            else:
+                index = min(candidates, key=lambda i: self.state_list[i].ejected_until)
+                if require_capacity and not self.has_capacity(index):
+                    return None
+            state = self.state_list[index]
+            if state.failures >= self.max_failures:
+                state.ejected_until = now + self.eject_seconds
+            state.outstanding += 1
             self.visit_num += 1
-        return self.client_list[current_client_index].create(*args, **kwargs)
+            return index
+
+    def release(self, index):
+        with self.lock:
+            self.state_list[index].outstanding -= 1
+
+    def record(self, index, elapsed, ok):
+        with self.lock:
+            state = self.state_list[index]
+            state.outstanding -= 1
+            if ok:
+                self.latency_history.append(elapsed)
+                if state.latency is None:
+                    state.latency = elapsed
+                else:
+                    state.latency = self.latency_alpha * elapsed + (1 - self.latency_alpha) * state.latency
+                state.failures = 0
+                state.ejected_until = 0.0
+                return
+            state.failures += 1
+            if state.failures >= self.max_failures:
+                backoff = min(2 ** (state.failures - self.max_failures), 32)
+                state.ejected_until = time.monotonic() + self.eject_seconds * backoff
+                print(f"{self.client_list[index].model} ejected for {self.eject_seconds * backoff:.0f}s after {state.failures} failures")
+
+    def dispatch(self, *args, **kwargs):
+        tried = []
+        while True:
+            index = self.select_client(tried)
+            start = time.monotonic()
+            try:
+                result = self.client_list[index].create(*args, **kwargs)
+            except Exception as exc:
+                if not is_endpoint_error(exc):
+                    self.release(index)
+                    raise
+                self.record(index, time.monotonic() - start, False)
+                tried.append(index)
+                if len(tried) >= self.client_num:
+                    raise
+                print(f"{self.client_list[index].model} failed ({exc}), retrying on another endpoint")
+                continue
+            self.record(index, time.monotonic() - start, True)
+            return result
+
+    def cache_key(self, kwargs):
+        return content_hash(json.dumps({
+            "endpoint_models": self.endpoint_models,
+            "request": kwargs,
+        }, sort_keys=True, default=str))
+
+    def create(self, *args, use_cache=True, parse=None, **kwargs):
+        parse = parse or (lambda completion: completion)
+        if self.cache is None or not use_cache or args or kwargs.get("stream"):
+            return parse(self.dispatch(*args, **kwargs))
+        key = self.cache_key(kwargs)
+        cached = self.cache.get(key)
+        if cached is not None:
+            try:
+                return parse(ChatCompletion.model_validate(cached))
+            except Exception:
+                print("cached answer could not be parsed, evicting it")
+                self.cache.delete(key)
+                raise
+        completion = self.dispatch(*args, **kwargs)
+        result = parse(completion)
+        self.cache.set(key, completion.model_dump(mode="json"))
+        return result
+
+class AsyncCompletionsWrapper(CompletionsWrapper):
+    api_wrapper = AsyncAPIWrapper
+
+    def __init__(self, *args, hedge_percentile=None, hedge_min_samples=10, hedge_default_delay=60.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.condition = LoopLocal(asyncio.Condition)
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_default_delay = hedge_default_delay
+        self.hedges_fired = 0
+        self.hedges_won = 0
+
+    async def acquire_client(self, exclude=()):
+        condition = self.condition.get()
+        async with condition:
+            while True:
+                index = self.select_client(exclude, require_capacity=True)
+                if index is not None:
+                    return index
+                try:
+                    await asyncio.wait_for(condition.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def finish(self, index, elapsed=None, ok=None):
+        if ok is None:
+            self.release(index)
+        else:
+            self.record(index, elapsed, ok)
+        condition = self.condition.get()
+        async with condition:
+            condition.notify_all()
+
+    async def dispatch(self, *args, tried=None, started=None, **kwargs):
+        tried = [] if tried is None else tried
+        while True:
+            index = await self.acquire_client(tried)
+            tried.append(index)
+            if started is not None:
+                started.set()
+            start = time.monotonic()
+            try:
+                result = await self.client_list[index].create(*args, **kwargs)
+            except asyncio.CancelledError:
+                await asyncio.shield(self.finish(index))
+                raise
+            except Exception as exc:
+                if not is_endpoint_error(exc):
+                    await self.finish(index)
+                    raise
+                await self.finish(index, time.monotonic() - start, False)
+                if len(tried) >= self.client_num:
+                    raise
+                print(f"{self.client_list[index].model} failed ({exc}), retrying on another endpoint")
+                continue
+            await self.finish(index, time.monotonic() - start, True)
+            return result
+
+    def hedge_delay(self):
+        history = sorted(self.latency_history)
+        if len(history) < self.hedge_min_samples:
+            return self.hedge_default_delay
+        return history[min(int(len(history) * self.hedge_percentile), len(history) - 1)]
+
+    async def hedged_dispatch(self, *args, **kwargs):
+        if self.hedge_percentile is None or self.client_num < 2:
+            return await self.dispatch(*args, **kwargs)
+
+        primary_tried = []
+        started = asyncio.Event()
+        primary = asyncio.create_task(self.dispatch(*args, tried=primary_tried, started=started, **kwargs))
+        started_waiter = asyncio.create_task(started.wait())
+        await asyncio.wait({primary, started_waiter}, return_when=asyncio.FIRST_COMPLETED)
+        started_waiter.cancel()
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_delay())
+        if done or len(primary_tried) >= self.client_num:
+            return await primary
+
+        self.hedges_fired += 1
+        print(f"request slower than p{self.hedge_percentile * 100:.0f}, hedging on another endpoint")
+        hedge = asyncio.create_task(self.dispatch(*args, tried=list(primary_tried), **kwargs))
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedges_won += 1
+                        return task.result()
+                    error = task.exception()
+                    if not is_endpoint_error(error):
+                        raise error
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def apply_parse(self, completion, parse):
+        if parse is None:
+            return completion
+        return await parse(completion)
+
+    async def cached_dispatch(self, key, parse, *args, **kwargs):
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is not None:
+            try:
+                return await self.apply_parse(ChatCompletion.model_validate(cached), parse)
+            except Exception:
+                print("cached answer could not be parsed, evicting it")
+                await asyncio.to_thread(self.cache.delete, key)
+                raise
+        completion = await self.hedged_dispatch(*args, **kwargs)
+        result = await self.apply_parse(completion, parse)
+        await asyncio.to_thread(self.cache.set, key, completion.model_dump(mode="json"))
+        return result
+
+    async def create(self, *args, use_cache=True, parse=None, **kwargs):
+        if self.cache is None or not use_cache or args or kwargs.get("stream"):
+            return await self.apply_parse(await self.hedged_dispatch(*args, **kwargs), parse)
+        return await self.cached_dispatch(self.cache_key(kwargs), parse, *args, **kwargs)
+
+    async def create_streamed(self, *args, use_cache=True, parse=None, **kwargs):
+        kwargs.pop("stream", None)
+        if self.cache is None or not use_cache or args:
+            return await self.apply_parse(await self.hedged_dispatch(*args, stream=True, **kwargs), parse)
+        key = self.cache_key({**kwargs, "stream": False})
+        return await self.cached_dispatch(key, parse, *args, stream=True, **kwargs)
 
 class ChatWrapper:
-    def __init__(self, config_list):
-        self.completions = CompletionsWrapper(config_list)
+    completions_wrapper = CompletionsWrapper
+
+    def __init__(self, config_list, cache=None, **options):
+        self.completions = self.completions_wrapper(config_list, cache, **options)
         self.client_num = self.completions.client_num
 
+class AsyncChatWrapper(ChatWrapper):
+    completions_wrapper = AsyncCompletionsWrapper
+
 class ClientWrapper:
-    def __init__(self, config_list, workers_per_api=1):
-        self.chat = ChatWrapper(config_list)
-        self.max_workers = self.chat.client_num * workers_per_api
+    chat_wrapper = ChatWrapper
+
+    def __init__(self, config_list, cache=None, **options):
+        self.chat = self.chat_wrapper(config_list, cache, **options)
 
-client = ClientWrapper(config_list)
+class AsyncClientWrapper(ClientWrapper):
+    chat_wrapper = AsyncChatWrapper
+
+llm_cache = DiskCache("./cache/llm.sqlite", max_entries=20000, ttl=7 * 24 * 3600)
+client = ClientWrapper(config_list, cache=llm_cache)
+async_client = AsyncClientWrapper(config_list, cache=llm_cache)
 
 def extract_from_code_block(text):
     matches = re.findall(r'```(.*?)```', text, re.DOTALL)
@@ -56,41 +403,143 @@ def extract_from_code_block(text):
         print("No code blocks found")
         return []
 
+def strip_code_fence(text):
+    text = text.strip()
+    fence = re.match(r'^```[^\n]*\n(.*?)(?:```\s*)?$', text, re.DOTALL)
+    if fence:
+        text = fence.group(1).strip()
+    label = re.match(r'^[A-Za-z][\w -]*\n', text)
+    if label:
+        text = text[label.end():].strip()
+    if text.startswith("<") and text.endswith(">"):
+        text = text[1:-1].strip()
+    return text
+
+
+json_quote_pairs = {'"': '"', "'": "'", "“": "”", "”": "”", "‘": "’"}
+json_literals = {"True": "true", "False": "false", "None": "null"}
+json_escapes = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+def repair_json(text):
+    out = []
+    stack = []
+    closer = None
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if closer is not None:
+            if char == "\\" and i + 1 < len(text):
+                out.append(text[i:i + 2])
+                i += 2
+                continue
+            if char == closer or (closer != "'" and char in '"”'):
+                rest = text[i + 1:].lstrip()
+                if rest == "" or rest[0] in ",:}]":
+                    out.append('"')
+                    closer = None
+                else:
+                    out.append('\\"' if char == '"' else char)
+            elif char == '"':
+                out.append('\\"')
+            elif char in json_escapes:
+                out.append(json_escapes[char])
+            elif ord(char) < 0x20:
+                out.append(f"\\u{ord(char):04x}")
+            else:
+                out.append(char)
+            i += 1
+            continue
+        if char in json_quote_pairs:
+            closer = json_quote_pairs[char]
+            out.append('"')
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+            out.append(char)
+        elif char in "}]":
+            while out and out[-1].strip() in ("", ","):
+                if out[-1] == ",":
+                    out.pop()
+                    break
+                out.pop()
+            if stack and stack[-1] == char:
+                stack.pop()
+            out.append(char)
+        elif char == "/" and text.startswith("//", i):
+            end = text.find("\n", i)
+            i = len(text) if end == -1 else end
+            continue
+        elif char.isalpha():
+            word = re.match(r'\w+', text[i:]).group(0)
+            if text[i + len(word):].lstrip().startswith(":"):
+                out.append(f'"{word}"')
+            else:
+                out.append(json_literals.get(word, word))
+            i += len(word)
+            continue
+        else:
+            out.append(char)
+        i += 1
+    if closer is not None:
+        out.append('"')
+    while out and out[-1].strip() in ("", ","):
+        out.pop()
+    out.extend(reversed(stack))
+    return json.loads("".join(out))
+
 
 reformat_json_prompt = '''Please convert invalid input json to valid json.
 The output should be presented within a code block in the following format: "json\n<output>", where "<output>" is the placeholder for the output.
 '''
-def reformat_json(text):
+def parse_reformatted_json(completion):
+    result = completion.choices[0].message.content
+    new_result = strip_code_fence(extract_from_code_block(result)[0])
+    return json.loads(new_result)
+
+def reformat_json(text, use_cache=True):
     global reformat_json_prompt, client
-    completion = client.chat.completions.create(
+    return client.chat.completions.create(
             model="qwen-plus",
             messages=[
                 {'role': 'system', 'content': reformat_json_prompt},
                 {'role': 'user', 'content': f'```input json\n{text}```'}
             ],
             stream=False,
-            temperature=0.01
+            temperature=0.01,
+            use_cache=use_cache,
+            parse=parse_reformatted_json
         )
-    
-    result = completion.choices[0].message.content
-    new_result = extract_from_code_block(result)[0].strip("json\n").strip("<").strip(">")
-    return json.loads(new_result)
 
 def reformat_json_multi_round(text, num_round=3):
     current_round = 0
     while current_round < num_round:
         try:
-            result = reformat_json(text)
+            result = reformat_json(text, use_cache=current_round == 0)
             return result
         except Exception as e:
             print(f"{current_round} failed", e)
         current_round += 1
 
+json_parse_lock = threading.Lock()
+json_parse_stats = {"direct": 0, "repaired": 0, "llm": 0, "failed": 0}
+
+def count_json_parse(path):
+    with json_parse_lock:
+        json_parse_stats[path] += 1
+
 def extract_json_from_str(str):
-    result_str = str.strip("json\n").strip("<").strip(">")
+    result_str = strip_code_fence(str)
     try:
         result_json = json.loads(result_str)
+        count_json_parse("direct")
+        return result_json
+    except json.JSONDecodeError:
+        pass
+    try:
+        result_json = repair_json(result_str)
+        count_json_parse("repaired")
+        return result_json
     except Exception as e:
         print(f"Exception: {e}")
-        result_json = reformat_json_multi_round(result_str)
-    return result_json
\ No newline at end of file
+    result_json = reformat_json_multi_round(result_str)
+    count_json_parse("llm" if result_json is not None else "failed")
+    return result_json
@@ -1,63 +1,34 @@
 import sys
 import os
+import argparse
 import json
 import re
+import time
+import bisect
+import tracemalloc
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import spacy
 import enchant
+from name_index import load_name_index, rss_mb
+from cache import DiskCache, content_hash
+from loader import read_structure_data
 
 
-def concatenate_values(structure):
-    result = []
-    if isinstance(structure, str):
-        result.append(structure)
-    if isinstance(structure, list):
-        if len(structure) != 0:
-            for v in structure:
-                result.append(concatenate_values(v))
-    if isinstance(structure, dict):
-        if len(structure.values()) != 0:
-            for v in structure.values():
-                result.append(concatenate_values(v))
-    result = [item for item in result if item is not None]
-    return "\n".join(result)
-
-def read_structure_data(json_path):
-    section_name_list = [
-        "title",
-        "abstract",
-        "introduction",
-        "related work",
-        "experiment",
-        "conclusion",
-        "limitation",
-        "appendix",
-        "checklist",
-        "image",
-        "table",
-    ]
-    with open(json_path, encoding='utf-8') as f:
-        json_data = json.load(f)
-    new_json_data = dict()
-    for key in json_data['structure'].keys():
-        for sn in section_name_list:
-            if sn in key.lower():
-                new_json_data[sn] = concatenate_values(json_data['structure'][key])
-    empty_key_list = []
-    for key in new_json_data.keys():
-        value_idx_list = new_json_data[key].split("\n")
-        value_list = []
-        for idx in value_idx_list:
-            if idx != "":
-                value_list.append(json_data['data'][idx])
-        new_json_data[key] = "\n".join(value_list)
-        if new_json_data[key] == "":
-            empty_key_list.append(key)
-    for key in empty_key_list:
-        new_json_data.pop(key)
-    if "related work" in new_json_data.keys():
-        new_json_data['related_work'] = new_json_data['related work']
-        new_json_data.pop("related work")
-    return new_json_data
+class UniqueList(list):
+    def __init__(self, items=()):
+        super().__init__()
+        self.seen = set()
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item):
+        return item in self.seen
+
+    def add(self, item):
+        if item not in self.seen:
+            self.seen.add(item)
+            self.append(item)
 
 class IndependentFormulaCheck:
     def __init__(self):
@@ -65,7 +36,7 @@ class IndependentFormulaCheck:
         self.right = self.left
         self.pattern = f"{self.left}(.*?){self.right}"
         self.cloth_content = []
-        self.error = []
+        self.error = UniqueList()
 
     def __repr__(self):
         return "\n".join([
@@ -82,13 +53,11 @@ class IndependentFormulaCheck:
         for match in re.finditer(self.left, str):
             start = max(match.start()- 10, 0)
             end = min(match.end() + 10, len(str))
-            if str[start:end] not in self.error:
-                self.error.append(str[start:end])
+            self.error.add(str[start:end])
         for match in re.finditer(self.right, str):
             start = max(match.start()- 10, 0)
             end = min(match.end() + 10, len(str))
-            if str[start:end] not in self.error:
-                self.error.append(str[start:end])
+            self.error.add(str[start:end])
         return str
 
 class InlineFormulaCheck:
@@ -97,7 +66,7 @@ class InlineFormulaCheck:
         self.right = self.left
         self.pattern = f"{self.left}(.*?){self.right}"
         self.cloth_content = []
-        self.error = []
+        self.error = UniqueList()
 
     def __repr__(self):
         return "\n".join([
@@ -114,45 +83,120 @@ class InlineFormulaCheck:
         for match in re.finditer(self.left, str):
             start = max(match.start()- 10, 0)
             end = min(match.end() + 10, len(str))
-            if str[start:end] not in self.error:
-                self.error.append(str[start:end])
+            self.error.add(str[start:end])
         for match in re.finditer(self.right, str):
             start = max(match.start()- 10, 0)
             end = min(match.end() + 10, len(str))
-            if str[start:end] not in self.error:
-                self.error.append(str[start:end])
+            self.error.add(str[start:end])
         return str
     
-def extract_nested_parentheses(str, left, right, strip=False, filter_pattern=None):
-    def find_innermost_parentheses(text):
+class BracketEngine:
+    def __init__(self, checks):
+        self.checks = checks
+        self.family = dict()
+        for idx, check in enumerate(self.checks):
+            self.family[check.left] = idx
+            self.family[check.right] = idx
+        self.char_pattern = re.compile("[" + re.escape("".join(self.family.keys())) + "]")
+
+    def __repr__(self):
+        return "".join(str(check) for check in self.checks)
+
+    def visible_positions(self, positions, spans):
+        result = []
+        span_idx = 0
+        for pos in positions:
+            while span_idx < len(spans) and spans[span_idx][1] <= pos:
+                span_idx += 1
+            if span_idx < len(spans) and spans[span_idx][0] <= pos:
+                continue
+            result.append(pos)
+        return result
+
+    def merge_spans(self, spans):
+        merged = []
+        for start, end in sorted(spans):
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return merged
+
+    def apply_spans(self, str, spans):
+        pieces = []
+        prev = 0
+        starts = []
+        removed_before = []
+        removed = 0
+        for start, end in spans:
+            pieces.append(str[prev:start])
+            prev = end
+            removed += end - start
+            starts.append(start)
+            removed_before.append(removed)
+        pieces.append(str[prev:])
+
+        def to_stage(pos):
+            idx = bisect.bisect_right(starts, pos)
+            return pos - (removed_before[idx - 1] if idx else 0)
+        return "".join(pieces), to_stage
+
+    def match_pairs(self, str, check, positions):
         stack = []
-        innermost_pairs = []
-        for i, char in enumerate(text):
-            if char == left:
-                stack.append(i)
-            elif char == right:
-                if stack:
-                    start = stack.pop()
-                    if not stack:
-                        innermost_pairs.append((start, i))
-        return innermost_pairs
-
-    cloth_content = []
-    while True:
-        pairs = find_innermost_parentheses(str)
-        if not pairs:
-            break
-        
-        for start, end in reversed(pairs):
-            content = str[start+1:end]
-            if not (filter_pattern and re.findall(filter_pattern, content)):
-                cloth_content.append(content)
-            if not strip or (filter_pattern and re.findall(filter_pattern, content)):
-                str = str[:start] + str[end+1:]
+        pairs = []
+        valid_num = 0
+        for pos in positions:
+            if str[pos] == check.left:
+                stack.append(pos)
+            elif stack:
+                start = stack.pop()
+                pairs.append((start, pos, len(stack), stack[-1] if stack else None))
+                if not stack:
+                    valid_num = len(pairs)
+        return pairs[:valid_num]
+
+    def forward(self, str):
+        positions = [[] for _ in self.checks]
+        for match in self.char_pattern.finditer(str):
+            positions[self.family[match.group()]].append(match.start())
+
+        deleted = []
+        text, to_stage = str, lambda pos: pos
+        for idx, check in enumerate(self.checks):
+            visible = self.visible_positions(positions[idx], deleted)
+            pairs = self.match_pairs(str, check, visible)
+            cloth_content = []
+            spans = []
+            if check.strip:
+                removed_starts = set()
+                for start, end, depth, parent in sorted(pairs, key=lambda x: (x[2], -x[0])):
+                    if parent in removed_starts:
+                        removed_starts.add(start)
+                        continue
+                    content = text[to_stage(start) + 1:to_stage(end)]
+                    if check.filter_pattern and re.search(check.filter_pattern, content):
+                        removed_starts.add(start)
+                        spans.append((start, end + 1))
+                        continue
+                    cloth_content.append(content)
+                    spans.append((start, start + 1))
+                    spans.append((end, end + 1))
             else:
-                str = str[:start] + str[start+1:end] + str[end+1:]
+                for start, end, depth, parent in reversed(pairs):
+                    if depth == 0:
+                        cloth_content.append(text[to_stage(start) + 1:to_stage(end)])
+                        spans.append((start, end + 1))
+            check.cloth_content = cloth_content
+            check.removed_spans = sorted(spans)
 
-    return cloth_content, str
+            deleted = self.merge_spans(deleted + spans)
+            text, to_stage = self.apply_spans(str, deleted)
+            for pos in self.visible_positions(visible, deleted):
+                i = to_stage(pos)
+                start = max(i - 10, 0)
+                end = min(i + 10, len(text))
+                check.error.add(text[start:end])
+        return text
 
 class ParenthesesCheck:
     def __init__(self):
@@ -160,7 +204,9 @@ class ParenthesesCheck:
         self.right = ")"
         self.pattern = f"{self.left}(.*?){self.right}"
         self.cloth_content = []
-        self.error = []
+        self.removed_spans = []
+        self.error = UniqueList()
+        self.strip = True
         self.filter_pattern = r"^([a-f]|[1-9]|i|ii|iii|iv|v|vi)$"
 
     def __repr__(self):
@@ -177,16 +223,7 @@ class ParenthesesCheck:
         ]) + "\n\n"
 
     def forward(self, str):
-        self.cloth_content, str = extract_nested_parentheses(str, self.left, self.right, strip=True, filter_pattern= self.filter_pattern)
-        
-        for i in range(len(str)):
-            if str[i] != self.left and str[i] != self.right:
-                continue
-            start = max(i- 10, 0)
-            end = min(i + 10, len(str))
-            if str[start:end] not in self.error:
-                self.error.append(str[start:end])
-        return str
+        return BracketEngine([self]).forward(str)
     
 class BracesCheck:
     def __init__(self):
@@ -194,7 +231,10 @@ class BracesCheck:
         self.right = "}"
         self.pattern = f"{self.left}(.*?){self.right}"
         self.cloth_content = []
-        self.error = []
+        self.removed_spans = []
+        self.error = UniqueList()
+        self.strip = False
+        self.filter_pattern = None
 
     def __repr__(self):
         return "\n".join([
@@ -210,15 +250,7 @@ class BracesCheck:
         ]) + "\n\n"
 
     def forward(self, str):
-        self.cloth_content, str = extract_nested_parentheses(str, self.left, self.right)
-        for i in range(len(str)):
-            if str[i] != self.left and str[i] != self.right:
-                continue
-            start = max(i- 10, 0)
-            end = min(i + 10, len(str))
-            if str[start:end] not in self.error:
-                self.error.append(str[start:end])
-        return str
+        return BracketEngine([self]).forward(str)
     
 class BracketsCheck:
     def __init__(self):
@@ -226,7 +258,10 @@ class BracketsCheck:
         self.right = "]"
         self.pattern = f"{self.left}(.*?){self.right}"
         self.cloth_content = []
-        self.error = []
+        self.removed_spans = []
+        self.error = UniqueList()
+        self.strip = False
+        self.filter_pattern = None
 
     def __repr__(self):
         return "\n".join([
@@ -242,15 +277,7 @@ class BracketsCheck:
         ]) + "\n\n"
 
     def forward(self, str):
-        self.cloth_content, str = extract_nested_parentheses(str, self.left, self.right)
-        for i in range(len(str)):
-            if str[i] != self.left and str[i] != self.right:
-                continue
-            start = max(i- 10, 0)
-            end = min(i + 10, len(str))
-            if str[start:end] not in self.error:
-                self.error.append(str[start:end])
-        return str
+        return BracketEngine([self]).forward(str)
     
 class AngleBracketsCheck:
     def __init__(self):
@@ -258,7 +285,10 @@ class AngleBracketsCheck:
         self.right = ">"
         self.pattern = f"{self.left}(.*?){self.right}"
         self.cloth_content = []
-        self.error = []
+        self.removed_spans = []
+        self.error = UniqueList()
+        self.strip = False
+        self.filter_pattern = None
 
     def __repr__(self):
         return "\n".join([
@@ -274,15 +304,7 @@ class AngleBracketsCheck:
         ]) + "\n\n"
 
     def forward(self, str):
-        self.cloth_content, str = extract_nested_parentheses(str, self.left, self.right)
-        for i in range(len(str)):
-            if str[i] != self.left and str[i] != self.right:
-                continue
-            start = max(i- 10, 0)
-            end = min(i + 10, len(str))
-            if str[start:end] not in self.error:
-                self.error.append(str[start:end])
-        return str
+        return BracketEngine([self]).forward(str)
     
 class QuotationCheck:
     def __init__(self):
@@ -290,7 +312,10 @@ class QuotationCheck:
         self.right = "”"
         self.pattern = f"{self.left}(.*?){self.right}"
         self.cloth_content = []
-        self.error = []
+        self.removed_spans = []
+        self.error = UniqueList()
+        self.strip = True
+        self.filter_pattern = None
 
     def __repr__(self):
         return "\n".join([
@@ -306,15 +331,7 @@ class QuotationCheck:
         ]) + "\n\n"
 
     def forward(self, str):
-        self.cloth_content, str = extract_nested_parentheses(str, self.left, self.right, strip=True)
-        for i in range(len(str)):
-            if str[i] != self.left and str[i] != self.right:
-                continue
-            start = max(i- 10, 0)
-            end = min(i + 10, len(str))
-            if str[start:end] not in self.error:
-                self.error.append(str[start:end])
-        return str
+        return BracketEngine([self]).forward(str)
     
 class AbbreviationCheck:
     def __init__(self):
@@ -328,7 +345,97 @@ class AbbreviationCheck:
             str = re.sub(re.escape(item), "", str)
         return str
     
+def split_words(text):
+    prev = 0
+    for match in re.finditer("[\n ]", text):
+        yield text[prev:match.start()]
+        prev = match.end()
+    yield text[prev:]
+
+class ContextWindow:
+    def __init__(self, error, before=5, after=4):
+        self.error = error
+        self.history = deque(maxlen=before + 1)
+        self.after = after
+        self.pending = deque()
+
+    def push(self, word):
+        for item in self.pending:
+            item[0].append(word)
+            item[1] -= 1
+        while self.pending and self.pending[0][1] == 0:
+            self.error.append(" ".join(self.pending.popleft()[0]))
+        self.history.append(word)
+
+    def mark(self):
+        self.pending.append([list(self.history), self.after])
+
+    def close(self):
+        while self.pending:
+            self.error.append(" ".join(self.pending.popleft()[0]))
+
+class Vocabulary:
+    unit = "types"
+
+    def __init__(self, word_list=()):
+        self.positions = dict()
+        for pos, word in enumerate(word_list):
+            positions = self.positions.get(word)
+            if positions is None:
+                self.positions[word] = [pos]
+            else:
+                positions.append(pos)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __iter__(self):
+        return iter(self.positions)
+
+    def counts(self):
+        return {word: len(positions) for word, positions in self.positions.items()}
+
+    def token_count(self):
+        return sum(len(positions) for positions in self.positions.values())
+
+    def apply(self, check):
+        if check.granularity == "type":
+            kept = set(check.forward(list(self.positions)))
+            result = Vocabulary()
+            result.positions = {word: positions for word, positions in self.positions.items() if word in kept}
+            return result
+        if check.granularity == "occurrence":
+            return self.apply_per_occurrence(check)
+        raise ValueError(f"{type(check).__name__} needs token positions")
+
+    def apply_per_occurrence(self, check):
+        fields = [getattr(check, name) for name in check.occurrence_fields]
+        produced = [dict() for _ in fields]
+        outputs = dict()
+        for word, positions in self.positions.items():
+            lengths = [len(value) for value in fields]
+            for out_word in check.forward([word]):
+                outputs.setdefault(out_word, []).append(positions)
+            for value, length, items in zip(fields, lengths, produced):
+                if len(value) > length:
+                    items[word] = value[length:]
+                    del value[length:]
+
+        for value, items in zip(fields, produced):
+            occurrences = sorted((pos, word) for word in items for pos in self.positions[word])
+            for _, word in occurrences:
+                value.extend(items[word])
+
+        result = Vocabulary()
+        merged = [(sorted(pos for positions in position_lists for pos in positions), word)
+                  for word, position_lists in outputs.items()]
+        for positions, word in sorted(merged, key=lambda item: item[0][0]):
+            result.positions[word] = positions
+        return result
+
 class SpecialWordsCheck:
+    granularity = "type"
+
     def __init__(self):
         self.special_words = ["arxiv", "http"]
 
@@ -336,7 +443,9 @@ class SpecialWordsCheck:
         return ""
     
     def forward(self, word_list):
-        new_word_list = []
+        return list(self.stream(word_list))
+
+    def stream(self, word_list):
         for word in word_list:
             contain_special_words = False
             for sw in self.special_words:
@@ -344,14 +453,15 @@ class SpecialWordsCheck:
                     contain_special_words = True
                     break
             if not contain_special_words:
-                new_word_list.append(word)
-        return new_word_list
+                yield word
 
 class DashCheck:
+    granularity = "position"
+
     def __init__(self):
         
         self.error = []
-        self.hyphenated_compound_words = []
+        self.hyphenated_compound_words = UniqueList()
         
     def __repr__(self):
         return "\n".join([
@@ -366,22 +476,25 @@ class DashCheck:
             "```"
         ]) + "\n\n"
     
-    def  forward(self, word_list):
-        new_word_list = []
-        for idx, word in enumerate(word_list):
+    def forward(self, word_list):
+        return list(self.stream(word_list))
+
+    def stream(self, word_list):
+        context = ContextWindow(self.error)
+        for word in word_list:
+            context.push(word)
             word = word.replace("–", "-").replace("—", "-")
             if word.startswith("-") or word.endswith("-"):
-                start = max(idx- 5, 0)
-                end = min(idx + 5, len(word_list))
-                self.error.append(" ".join(word_list[start:end]))
+                context.mark()
             elif "-" in word:
-                if word not in self.hyphenated_compound_words:
-                    self.hyphenated_compound_words.append(word)
+                self.hyphenated_compound_words.add(word)
             else:
-                new_word_list.append(word)
-        return new_word_list
+                yield word
+        context.close()
     
 class SpecialCharactersCheck:
+    granularity = "occurrence"
+    occurrence_fields = ("words_with_special_characters",)
 
     def __init__(self):
         self.special_characters = ["@", "‡", "†"]
@@ -397,7 +510,9 @@ class SpecialCharactersCheck:
         ]) + "\n\n"
         
     def forward(self, word_list):
-        new_word_list = []
+        return list(self.stream(word_list))
+
+    def stream(self, word_list):
         for word in word_list:
             contain_special_character = False
             for sc in self.special_characters:
@@ -407,11 +522,12 @@ class SpecialCharactersCheck:
             if contain_special_character:
                 self.words_with_special_characters.append(word)
             else:
-                new_word_list.append(word)
-        return new_word_list
+                yield word
     
 
 class SinglePunctuationMarkCheck:
+    granularity = "type"
+
     def __init__(self):
         self.single_punctuation_mark = ["", ",", ".", ";", ":","-", "&"]
     
@@ -419,11 +535,16 @@ class SinglePunctuationMarkCheck:
         return ""
     
     def forward(self, word_list):
-        return [item for item in word_list if item not in  self.single_punctuation_mark]
+        return list(self.stream(word_list))
+
+    def stream(self, word_list):
+        return (item for item in word_list if item not in  self.single_punctuation_mark)
     
 
     
 class RightTailCheck:
+    granularity = "occurrence"
+    occurrence_fields = ("error",)
 
     def __init__(self):
         self.end_punctuation_mark = [",", ".", ":", ";", "?"]
@@ -440,7 +561,9 @@ class RightTailCheck:
         ]) + "\n\n"
 
     def forward(self, word_list):
-        new_word_list = []
+        return list(self.stream(word_list))
+
+    def stream(self, word_list):
         mark_len = len(self.end_punctuation_mark)
         for word in word_list:
             is_error = False
@@ -462,10 +585,10 @@ class RightTailCheck:
                 self.error.append(word)
             else:
                 if word != "":
-                    new_word_list.append(word)
-        return new_word_list
+                    yield word
 
 class SlashCheck:
+    granularity = "position"
 
     def __init__(self):
         self.error = []
@@ -480,21 +603,25 @@ class SlashCheck:
         ]) + "\n\n"
 
     def forward(self, word_list):
-        new_words_list = []
-        for idx, word in enumerate(word_list):
+        return list(self.stream(word_list))
+
+    def stream(self, word_list):
+        context = ContextWindow(self.error)
+        for word in word_list:
+            context.push(word)
             if "/" not in word:
-                new_words_list.append(word)
+                yield word
                 continue
             if word.startswith("/") or word.endswith("/"):
-                start = max(idx- 5, 0)
-                end = min(idx + 5, len(word_list))
-                self.error.append(" ".join(word_list[start:end]))
+                context.mark()
                 continue
 
-            new_words_list.extend(word.split("/"))
-        return new_words_list
+            yield from word.split("/")
+        context.close()
 
 class FilterWords:
+    granularity = "type"
+
     def __init__(self):
         self.patterns =[
             r'\b\d{1,3}(?:,\d{3})*\b|\b\d+(?:\.\d+)?\b',
@@ -502,77 +629,72 @@ class FilterWords:
             r'\b(?:11|12|13|[02-9]1|[013-9]2|[0124-9]3|[0-9]{2,})th|\b(?:1st|2nd|3rd|[4-9]th)\b',
             r'\b\d+(?:\.\d+)?[KMGTPkmgtp]?\b'
         ]
+        self.matcher = re.compile("|".join(f"(?:{pattern})" for pattern in self.patterns))
+
     def __repr__(self):
         return ""
     
     def forward(self, word_list):
-        new_word_list = []
+        return list(self.stream(word_list))
+
+    def stream(self, word_list):
+        verdicts = dict()
         for word in word_list:
-            filter = False
-            for pattern in self.patterns:
-                if re.findall(pattern, word):
-                    filter = True
-                    break
-            if not filter:
-                new_word_list.append(word)
-        return new_word_list
+            keep = verdicts.get(word)
+            if keep is None:
+                keep = verdicts[word] = self.matcher.search(word) is None
+            if keep:
+                yield word
     
 class NonAlphaCheck:
+    granularity = "type"
 
     def __init__(self):
         self.pattern = re.compile("^[A-Za-z]*$")
-        self.words_with_non_alpha = []
+        self.words_with_non_alpha = UniqueList()
 
     def __repr__(self):
         return "\n".join([
             "## Alpha Check",
             "Words with non alpha",
             "```json",
-            json.dumps(self.words_with_non_alpha, indent=4),
+            json.dumps(sorted(self.words_with_non_alpha, key = lambda x: len(x)), indent=4),
             "```"
         ]) + "\n\n"
     
     def forward(self, word_list):
-        new_word_list = []
+        return list(self.stream(word_list))
+
+    def stream(self, word_list):
         for word in word_list:
             if self.pattern.match(word):
-                new_word_list.append(word)
+                yield word
             else:
-                if word not in self.words_with_non_alpha:
-                    self.words_with_non_alpha.append(word)
-
-        self.words_with_non_alpha.sort(key = lambda x: len(x))
-        return new_word_list
+                self.words_with_non_alpha.add(word)
 
 class NameCheck:
-    def __init__(self):
-        english_name_path = "./english_name.txt"
-        if not os.path.exists(english_name_path):
-            self.english_names = set()
-        else:
-            with open(english_name_path, encoding='utf-8') as f:
-                self.english_names = f.read().split("\n")
-            self.english_names = set(item.lower() for item in self.english_names if item != "")
+    granularity = "type"
 
-        chinese_name_path = "./chinese_name.txt"
-        if not os.path.exists(chinese_name_path):
-            self.chinese_name = set()
-        else:
-            with open(chinese_name_path, encoding='utf-8') as f:
-                self.chinese_name = f.read().split("\n")
-            self.chinese_name = set(item.lower() for item in self.chinese_name if item != "")
+    def __init__(self):
+        start = time.perf_counter()
+        self.english_names = load_name_index("./english_name.txt")
+        self.chinese_name = load_name_index("./chinese_name.txt")
+        print(f"name index loaded in {time.perf_counter() - start:.3f}s, rss {rss_mb():.1f} MB")
 
     def __repr__(self):
         return ""
     
     def forward(self, word_list):
-        new_word_list = []
+        return list(self.stream(word_list))
+
+    def stream(self, word_list):
         for word in word_list:
             if not (word.lower() in self.chinese_name or word.lower() in self.english_names):
-                new_word_list.append(word)
-        return new_word_list
+                yield word
     
 class LocalDictFilter:
+    granularity = "type"
+
     def __init__(self):
         technical_words_path = "./technical_words.txt"
         if not os.path.exists(technical_words_path):
@@ -594,37 +716,61 @@ class LocalDictFilter:
         return ""
     
     def forward(self, word_list):
-        new_word_list = []
+        return list(self.stream(word_list))
+
+    def stream(self, word_list):
         for word in word_list:
             if word.lower() not in self.technical_words and word.lower() not in self.custom_words:
-                new_word_list.append(word)
-        return new_word_list
+                yield word
     
-nlp = spacy.load("en_core_web_sm")
+nlp = spacy.load("en_core_web_sm", exclude=["parser", "ner"])
 spell_dict = enchant.Dict("en_US")
-def lemmatize(word):
+def lemmatize_batch(word_list, batch_size=256):
     global nlp
-    doc = nlp(word)
-    if len(doc) > 0:
-        return doc[0].lemma_
-    return word
-
+    lemma_list = []
+    for word, doc in zip(word_list, nlp.pipe(word_list, batch_size=batch_size)):
+        lemma_list.append(doc[0].lemma_ if len(doc) > 0 else word)
+    return lemma_list
 
-def spell_check(word):
+def spell_check_detail(word_list):
     global spell_dict
 
-    original_lower = word.lower()
-    if spell_dict.check(original_lower):
-        return True
-    
-    lemma = lemmatize(original_lower)
-    if lemma != original_lower and spell_dict.check(lemma):
-        return True
-    return False
+    verdict_list = []
+    miss_idx_list = []
+    for idx, word in enumerate(word_list):
+        original_lower = word.lower()
+        if spell_dict.check(original_lower):
+            verdict_list.append((True, None))
+        else:
+            verdict_list.append((False, None))
+            miss_idx_list.append(idx)
+
+    miss_list = [word_list[idx].lower() for idx in miss_idx_list]
+    for idx, original_lower, lemma in zip(miss_idx_list, miss_list, lemmatize_batch(miss_list)):
+        verdict_list[idx] = (lemma != original_lower and spell_dict.check(lemma), lemma)
+    return verdict_list
+
+def spell_check_batch(word_list):
+    return [found for found, _ in spell_check_detail(word_list)]
+
+def spell_check_version():
+    global nlp, spell_dict
+    return "|".join([
+        f"enchant-{enchant.__version__}",
+        spell_dict.tag,
+        spell_dict.provider.name,
+        f"spacy-{spacy.__version__}",
+        f"{nlp.meta.get('name')}-{nlp.meta.get('version')}",
+    ])
 
 class SpacyDictFilter:
-    def __init__(self):
-        self.error = []
+    granularity = "type"
+
+    def __init__(self, batch_size=2048, cache_path="./cache/spell.sqlite", cache_size=200000):
+        self.error = UniqueList()
+        self.batch_size = batch_size
+        self.cache = DiskCache(cache_path, max_entries=cache_size) if cache_path else None
+        self.cache_version = spell_check_version() if cache_path else ""
 
     def __repr__(self):
         return "\n".join([
@@ -635,60 +781,81 @@ class SpacyDictFilter:
         ]) + "\n\n"
     
     def forward(self, word_list):
+        return list(self.stream(word_list))
 
+    def lookup(self, batch):
+        if self.cache is None:
+            return [found for found, _ in spell_check_detail(batch)]
+        key_list = [content_hash(self.cache_version, word.lower()) for word in batch]
+        cached = self.cache.get_many(key_list)
+        miss_idx_list = [idx for idx, key in enumerate(key_list) if key not in cached]
+        new_entries = dict()
+        for idx, (found, lemma) in zip(miss_idx_list, spell_check_detail([batch[idx] for idx in miss_idx_list])):
+            new_entries[key_list[idx]] = {"word": batch[idx].lower(), "found": found, "lemma": lemma}
+        self.cache.set_many(new_entries)
+        cached.update(new_entries)
+        return [cached[key]["found"] for key in key_list]
+
+    def resolve(self, batch, found_set, unfound_set):
+        for word, found in zip(batch, self.lookup(batch)):
+            if found:
+                found_set.add(word)
+            else:
+                self.error.add(word)
+                unfound_set.add(word)
+
+    def stream(self, word_list):
         found_set = set()
         unfound_set = set()
-        new_word_list = []
+        pending = []
+        batch = UniqueList()
+        word_num = 0
+        elapsed = 0.0
         for word in word_list:
-            if word in found_set:
-                new_word_list.append(word)
-                continue
-            if word in unfound_set:
-                continue
-            if spell_check(word):
-                new_word_list.append(word)
-                found_set.add(word)
+            word_num += 1
+            if not pending:
+                if word in found_set:
+                    yield word
+                    continue
+                if word in unfound_set:
+                    continue
+            pending.append(word)
+            if word not in found_set and word not in unfound_set:
+                batch.add(word)
+            if len(pending) < self.batch_size:
                 continue
-            self.error.append(word)
-            unfound_set.add(word)
-        return new_word_list
+            start = time.perf_counter()
+            self.resolve(batch, found_set, unfound_set)
+            elapsed += time.perf_counter() - start
+            yield from (item for item in pending if item in found_set)
+            pending = []
+            batch = UniqueList()
 
-def main():
-    if len(sys.argv) != 2:
-        print("Usage: python script.py <json_file_path>")
-        sys.exit(1)
-
-    file_path = sys.argv[1]
-    if not os.path.exists(file_path):
-        print(f"File not found: {file_path}")
-        sys.exit(1)
+        start = time.perf_counter()
+        self.resolve(batch, found_set, unfound_set)
+        elapsed += time.perf_counter() - start
+        yield from (item for item in pending if item in found_set)
+        if elapsed > 0:
+            print(f"spell check: {word_num} words in {elapsed:.3f}s ({word_num / elapsed:.0f} words/s)")
+        if self.cache is not None:
+            print(f"spell cache: {self.cache.hits} hits, {self.cache.misses} misses")
 
-    base_name = os.path.basename(file_path)
-    data = read_structure_data(file_path)
-    
-    word_report = f"# {base_name.split('.')[0]}\n\n"
-
-    text = ""
-    for section in data.values():
-        text += section + "\n"
-
-    str_pipeline = [
+def build_str_pipeline():
+    return [
         IndependentFormulaCheck(),
         InlineFormulaCheck(),
-        ParenthesesCheck(),
-        BracesCheck(),
-        BracketsCheck(),
-        AngleBracketsCheck(),
-        QuotationCheck(),
+        BracketEngine([
+            ParenthesesCheck(),
+            BracesCheck(),
+            BracketsCheck(),
+            AngleBracketsCheck(),
+            QuotationCheck(),
+        ]),
         AbbreviationCheck()
     ]
-    for check in str_pipeline:
-        text = check.forward(text)
-        word_report += str(check)
 
-    word_list = re.split("[\n ]", text)
-
-    word_list_pipeline = [
+def build_word_list_pipeline(spell_cache_path="./cache/spell.sqlite"):
+    return [
         SpecialWordsCheck(),
         SlashCheck(),
         DashCheck(),
@@ -699,16 +866,165 @@ def main():
         NonAlphaCheck(),
         NameCheck(),
         LocalDictFilter(),
-        SpacyDictFilter()
+        SpacyDictFilter(cache_path=spell_cache_path)
     ]
+
+def join_sections(data):
+    text = ""
+    for section in data.values():
+        text += section + "\n"
+    return text
+
+def run_word_list_pipeline(word_list_pipeline, text, profiler=None):
+    split = max([idx + 1 for idx, check in enumerate(word_list_pipeline) if check.granularity == "position"], default=0)
+    if profiler is None:
+        word_list = split_words(text)
+        for check in word_list_pipeline[:split]:
+            word_list = check.stream(word_list)
+        vocabulary = Vocabulary(word_list)
+        for check in word_list_pipeline[split:]:
+            vocabulary = vocabulary.apply(check)
+    else:
+        word_list = profiler.call("split_words", lambda text: list(split_words(text)), text)
+        for check in word_list_pipeline[:split]:
+            word_list = profiler.forward(check, word_list)
+        vocabulary = profiler.call("Vocabulary", Vocabulary, word_list)
+        for check in word_list_pipeline[split:]:
+            vocabulary = profiler.call(type(check).__name__, lambda vocabulary: vocabulary.apply(check), vocabulary)
+    return vocabulary
+
+class CheckProfiler:
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.records = []
+
+    def forward(self, check, value):
+        return self.call(type(check).__name__, check.forward, value)
+
+    def call(self, name, func, value):
+        size_in = len(value)
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        result = func(value)
+        elapsed = time.perf_counter() - start
+        record = {
+            "check": name,
+            "seconds": elapsed,
+            "unit": "chars" if isinstance(value, str) else getattr(value, "unit", "tokens"),
+            "input_size": size_in,
+            "output_size": len(result),
+        }
+        if isinstance(result, Vocabulary):
+            record["output_tokens"] = result.token_count()
+        if self.trace_memory:
+            record["peak_alloc_bytes"] = tracemalloc.get_traced_memory()[1] - base
+        self.records.append(record)
+        return result
+
+    def to_json(self):
+        return {
+            "total_seconds": sum(record["seconds"] for record in self.records),
+            "trace_memory": self.trace_memory,
+            "checks": self.records,
+        }
+
+    def table(self):
+        total = sum(record["seconds"] for record in self.records) or 1.0
+        lines = [f"{'check':<28} {'seconds':>9} {'share':>6} {'unit':>6} {'in':>9} {'out':>9} {'peak KB':>9}"]
+        for record in self.records:
+            peak = record.get("peak_alloc_bytes")
+            lines.append(
+                f"{record['check']:<28} {record['seconds']:9.4f} {record['seconds'] / total:6.1%} {record['unit']:>6} "
+                f"{record['input_size']:9d} {record['output_size']:9d} {'' if peak is None else f'{peak / 1024:.1f}':>9}"
+            )
+        return "\n".join(lines)
+
+def check_words(data, name, spell_cache_path="./cache/spell.sqlite", profiler=None):
+    word_report = f"# {name}\n\n"
+
+    text = join_sections(data)
+
+    str_pipeline = build_str_pipeline()
+    for check in str_pipeline:
+        text = check.forward(text) if profiler is None else profiler.forward(check, text)
+        word_report += str(check)
+
+    word_list_pipeline = build_word_list_pipeline(spell_cache_path)
+    run_word_list_pipeline(word_list_pipeline, text, profiler)
     for check in word_list_pipeline:
-        word_list = check.forward(word_list)
         word_report += str(check)
+    return word_report
+
+def check_file(file_path, data=None, profiler=None):
+    base_name = os.path.basename(file_path)
+    if data is None:
+        data = read_structure_data(file_path)
+    word_report = check_words(data, base_name.split('.')[0], profiler=profiler)
 
     os.makedirs("./data", exist_ok=True)
     output_name =  base_name.split(".")[0]+"_word.md"
-    with open("./data/" + output_name, 'w', encoding='utf-8') as f:
+    output_path = "./data/" + output_name
+    with open(output_path, 'w', encoding='utf-8') as f:
         f.write(word_report)
+    return output_path
+
+def collect_file_paths(path):
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith(".json"))
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() != ""]
+
+def check_batch(file_path_list, max_workers=None):
+    load_name_index("./english_name.txt")
+    load_name_index("./chinese_name.txt")
+
+    start = time.perf_counter()
+    done_num = 0
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        future_to_path = {executor.submit(check_file, path): path for path in file_path_list}
+        for future in as_completed(future_to_path):
+            path = future_to_path[future]
+            try:
+                print(f"{path} -> {future.result()}")
+                done_num += 1
+            except Exception as exc:
+                print(f"{path} generated an exception: {exc}")
+    elapsed = time.perf_counter() - start
+    print(f"{done_num} documents in {elapsed:.2f}s ({done_num / elapsed:.2f} docs/s)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Word level check")
+    parser.add_argument("path", help="<json_file_path>, a directory of json files, or a manifest with --manifest")
+    parser.add_argument("--manifest", action="store_true", help="path is a text file with one json path per line")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes in batch mode (default: cpu count)")
+    parser.add_argument("--profile", default=None, help="write per-check timings and input/output sizes to this json file (single file mode)")
+    parser.add_argument("--profile-table", action="store_true", help="print the per-check profile as a table")
+    parser.add_argument("--profile-memory", action="store_true", help="also record peak allocation per check with tracemalloc, which slows the checks down")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        print(f"File not found: {args.path}")
+        sys.exit(1)
+
+    if os.path.isdir(args.path) or args.manifest:
+        check_batch(collect_file_paths(args.path), args.workers)
+        return
+
+    profiler = None
+    if args.profile or args.profile_table or args.profile_memory:
+        profiler = CheckProfiler(trace_memory=args.profile_memory)
+    check_file(args.path, profiler=profiler)
+    if profiler is None:
+        return
+    if args.profile:
+        with open(args.profile, 'w', encoding='utf-8') as f:
+            json.dump(profiler.to_json(), f, indent=4)
+    if args.profile_table or not args.profile:
+        print(profiler.table())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file